@@ -24,8 +24,8 @@ rm -f "${OUTPUT_ZIP_FILE}"
 echo "Creating build directory: ${BUILD_DIR}/${PACKAGE_INSTALL_DIR}"
 mkdir -p "${BUILD_DIR}/${PACKAGE_INSTALL_DIR}"
 
-# 3. Install beautifulsoup4
-echo "Installing beautifulsoup4 for Python ${PYTHON_VERSION} on ${PLATFORM}..."
+# 3. Install lxml and orjson
+echo "Installing lxml and orjson for Python ${PYTHON_VERSION} on ${PLATFORM}..."
 pip install \
     --platform "${PLATFORM}" \
     --target "${BUILD_DIR}/${PACKAGE_INSTALL_DIR}" \
@@ -33,7 +33,8 @@ pip install \
     --python-version "${PYTHON_VERSION}" \
     --only-binary=:all: \
     --upgrade \
-    beautifulsoup4
+    lxml \
+    orjson
 
 # 4. Create the zip file
 echo "Creating Lambda layer zip file: ${OUTPUT_ZIP_FILE}..."
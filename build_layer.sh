@@ -28,8 +28,11 @@ mkdir -p "${BUILD_DIR}/${PACKAGE_INSTALL_DIR}"
 #    - pydantic: For data validation and settings management.
 #    - openai: For interacting with the OpenAI API.
 #    - requests: For making HTTP requests (used in your final_summary Lambda).
+#    - rapidfuzz: Fast fuzzy string matching for entity names (generate-narrative-summary).
+#    - orjson: Fast JSON parsing/serialization for AppSync payloads and S3 metadata.
+#    - h2: HTTP/2 support for httpx (multiplexed OpenAI image requests in generate-segment-images).
 #    NOTE: faiss-cpu and numpy have been moved to a separate layer (build_faiss_layer.sh)
-echo "Installing dependencies (pydantic, openai, requests) for Python ${PYTHON_VERSION} on ${PLATFORM}..."
+echo "Installing dependencies (pydantic, openai, requests, rapidfuzz, orjson, h2) for Python ${PYTHON_VERSION} on ${PLATFORM}..."
 pip install \
     --target "${BUILD_DIR}/${PACKAGE_INSTALL_DIR}" \
     --implementation cp \
@@ -38,7 +41,10 @@ pip install \
     --upgrade \
     pydantic \
     openai \
-    requests
+    requests \
+    rapidfuzz \
+    orjson \
+    h2
 
 # 4. Clean up unnecessary files from the package directory to reduce layer size
 echo "Cleaning up unnecessary files (.pyc, __pycache__, tests, etc.)..."
@@ -65,7 +71,7 @@ rm -rf "${BUILD_DIR}"
 echo "-----------------------------------------------------------------------"
 echo "Combined Python dependencies Lambda layer created successfully: ${OUTPUT_ZIP_FILE}"
 echo "Ensure this zip file is in the location expected by your Terraform script."
-echo "The layer includes: pydantic, openai, requests, and their dependencies."
+echo "The layer includes: pydantic, openai, requests, rapidfuzz, orjson, h2, and their dependencies."
 echo "Lambda function architecture should match: ${PLATFORM}"
 echo "Lambda runtime should be compatible with Python: ${PYTHON_VERSION}"
 echo "-----------------------------------------------------------------------"
@@ -23,7 +23,7 @@ docker run --rm \
     set -euo pipefail && \
     python -m pip install --upgrade pip && \
     mkdir -p ${LAYER_BUILD_DIR}/${SITE_PACKAGES_DIR} && \
-    pip install -t ${LAYER_BUILD_DIR}/${SITE_PACKAGES_DIR} pydantic openai requests thefuzz
+    pip install -t ${LAYER_BUILD_DIR}/${SITE_PACKAGES_DIR} pydantic openai requests thefuzz rapidfuzz orjson h2
   "
 
 # Zip the layer on the host (WSL) using the local zip binary
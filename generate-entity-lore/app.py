@@ -2,8 +2,10 @@
 import os
 import json
 import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 # --- Third-party Library Imports ---
 import requests
@@ -39,6 +41,11 @@ SESSION_NPCS_TABLE = os.environ.get('SESSION_NPCS_TABLE', 'SessionNpcs-dev')
 SESSION_LOCATIONS_TABLE = os.environ.get('SESSION_LOCATIONS_TABLE', 'SessionLocations-dev')
 SESSION_ADVENTURERS_TABLE = os.environ.get('SESSION_ADVENTURERS_TABLE', 'SessionAdventurers-dev')
 SESSION_LOOT_ITEMS_TABLE = os.environ.get('SESSION_LOOT_ITEMS_TABLE', 'SessionLootItems-dev')
+# Campaign-context cache written by generate-narrative-summary (optional)
+CAMPAIGN_CONTEXT_CACHE_TABLE = os.environ.get('CAMPAIGN_CONTEXT_CACHE_TABLE')
+
+# --- Description Update Flow Control ---
+MAX_INFLIGHT_UPDATES = int(os.environ.get('MAX_INFLIGHT_UPDATES', '20'))
 
 
 # --- Pydantic Models for LLM Output ---
@@ -344,62 +351,8 @@ mutation CreateCampaignAdventurers($input: CreateCampaignAdventurersInput!) {
 }
 """
 
-
-# --- AppSync Helper Function ---
-def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """Executes a GraphQL query/mutation against AppSync."""
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': APPSYNC_API_KEY_FROM_ENV
-    }
-    payload = {"query": query, "variables": variables or {}}
-
-    try:
-        response = requests.post(APPSYNC_API_URL, headers=headers, json=payload, timeout=90)
-        response.raise_for_status()
-        response_json = response.json()
-        if "errors" in response_json:
-            print(f"GraphQL Error: {json.dumps(response_json['errors'], indent=2)}")
-        return response_json
-    except requests.exceptions.RequestException as e:
-        print(f"Error making AppSync request: {e}")
-        return {"errors": [{"message": str(e)}]}
-
-
-def update_entity_description(entity_id: str, entity_type: str, highlights: List[str], debug: bool = False) -> bool:
-    """Updates an existing entity's description with new highlights using LLM."""
-    if not entity_id or not highlights:
-        return False
-
-    print(f"Updating description for {entity_type} ID: {entity_id}")
-
-    if entity_type == "Adventurer":
-        get_query, update_mutation = GET_ADVENTURER_DETAILS_QUERY, UPDATE_ADVENTURER_MUTATION
-        get_key, update_key = "getAdventurer", "updateAdventurer"
-    elif entity_type == "NPC":
-        get_query, update_mutation = GET_NPC_DETAILS_QUERY, UPDATE_NPC_MUTATION
-        get_key, update_key = "getNPC", "updateNPC"
-    elif entity_type == "Location":
-        get_query, update_mutation = GET_LOCATION_DETAILS_QUERY, UPDATE_LOCATION_MUTATION
-        get_key, update_key = "getLocation", "updateLocation"
-    elif entity_type == "LootItem":
-        get_query, update_mutation = GET_LOOT_ITEM_DETAILS_QUERY, UPDATE_LOOT_ITEM_MUTATION
-        get_key, update_key = "getLootItem", "updateLootItem"
-    else:
-        return False
-
-    try:
-        response_gql = execute_graphql_request(get_query, {"id": entity_id})
-        entity_data = response_gql.get("data", {}).get(get_key)
-        if not entity_data:
-            return False
-        
-        current_description = entity_data.get("description", "") or "This entity has no description yet."
-        current_version = entity_data["_version"]
-        entity_name = entity_data.get("name", "Unknown")
-
-        highlights_str = "\n".join(f"- {h}" for h in highlights)
-        prompt = f"""You are reviewing an entity's description to see if it needs updating based on new session highlights.
+# --- LLM Prompt Templates (filled with str.format) ---
+DESCRIPTION_UPDATE_PROMPT_TPL = """You are reviewing an entity's description to see if it needs updating based on new session highlights.
 
 The description should be a HIGH-LEVEL summary (1-3 sentences) of who/what this entity IS - their core identity, role, and defining traits.
 It should NOT chronicle their everyday activities or session-by-session events (that's what highlights are for).
@@ -411,48 +364,22 @@ ONLY update the description if the highlights reveal something CRITICAL that cha
 
 If the highlights are just normal session activities (conversations, travel, minor events), return the current description UNCHANGED.
 
-Entity: {entity_name}
-Current Description: "{current_description}"
+Entity: {name}
+Current Description: "{description}"
 
 New Highlights:
-{highlights_str}
+{highlights}
 
 Return ONLY the description (1-3 sentences). If no critical change occurred, return the current description exactly as-is:"""
 
-        completion = openai_client.chat.completions.create(
-            model="gpt-5.2",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.4,
-        )
-        updated_description = completion.choices[0].message.content.strip()
-
-        if updated_description and updated_description != current_description:
-            update_response = execute_graphql_request(update_mutation, {
-                "input": {"id": entity_id, "description": updated_description, "_version": current_version}
-            })
-            if update_response.get("data", {}).get(update_key):
-                print(f"✅ Updated {entity_type}: {entity_name}")
-                return True
-        return True  # No change needed is still success
-
-    except Exception as e:
-        print(f"Error updating {entity_type} {entity_id}: {e}")
-        return False
-
-
-def generate_entity_profile(entity_type: str, name: str, highlights: List[str], transcript_context: str = "") -> Optional[Dict]:
-    """Uses LLM to generate a full entity profile for a new entity."""
-    highlights_str = "\n".join(f"- {h}" for h in highlights)
-    
-    if entity_type == "NPC":
-        prompt = f"""Generate a TTRPG NPC profile based on session highlights. Please keep the description concise, do not be too verbose.
+NPC_PROFILE_PROMPT_TPL = """Generate a TTRPG NPC profile based on session highlights. Please keep the description concise, do not be too verbose.
 
 NPC Name: {name}
 Session Highlights:
-{highlights_str}
+{highlights}
 
 Additional Context:
-{transcript_context[:2000] if transcript_context else "Not provided"}
+{context}
 
 Output a JSON object with:
 - name: The NPC's name
@@ -462,17 +389,15 @@ Output a JSON object with:
 - race: Race if applicable (e.g., "Human", "Elf", "Dwarf") or null
 
 JSON:"""
-        model_class = GeneratedNPC
-        
-    elif entity_type == "Location":
-        prompt = f"""Generate a TTRPG location profile based on session highlights.
+
+LOCATION_PROFILE_PROMPT_TPL = """Generate a TTRPG location profile based on session highlights.
 
 Location Name: {name}
 Session Highlights:
-{highlights_str}
+{highlights}
 
 Additional Context:
-{transcript_context[:2000] if transcript_context else "Not provided"}
+{context}
 
 Output a JSON object with:
 - name: The location's name
@@ -481,17 +406,15 @@ Output a JSON object with:
 - type: Location type (e.g., "City", "Dungeon", "Tavern", "Forest", "Temple")
 
 JSON:"""
-        model_class = GeneratedLocation
-        
-    elif entity_type == "Adventurer":
-        prompt = f"""Generate a TTRPG adventurer profile based on session highlights. Please keep the description concise, do not be too verbose.
+
+ADVENTURER_PROFILE_PROMPT_TPL = """Generate a TTRPG adventurer profile based on session highlights. Please keep the description concise, do not be too verbose.
 
 Adventurer Name: {name}
 Session Highlights:
-{highlights_str}
+{highlights}
 
 Additional Context:
-{transcript_context[:2000] if transcript_context else "Not provided"}
+{context}
 
 Output a JSON object with:
 - name: The adventurer's name
@@ -500,17 +423,15 @@ Output a JSON object with:
 - race: Race (e.g., "Human", "Elf", "Dwarf", "Halfling") or null if unknown
 
 JSON:"""
-        model_class = GeneratedAdventurer
 
-    elif entity_type == "LootItem":
-        prompt = f"""Generate a TTRPG loot item profile based on session highlights. Keep the description concise.
+LOOT_ITEM_PROFILE_PROMPT_TPL = """Generate a TTRPG loot item profile based on session highlights. Keep the description concise.
 
 Item Name: {name}
 Session Highlights:
-{highlights_str}
+{highlights}
 
 Additional Context:
-{transcript_context[:2000] if transcript_context else "Not provided"}
+{context}
 
 Output a JSON object with:
 - name: The item's name
@@ -519,10 +440,197 @@ Output a JSON object with:
 - quantity: Integer quantity if known, otherwise null
 
 JSON:"""
-        model_class = GeneratedLootItem
 
-    else:
+
+# --- Per-Entity-Type Configuration ---
+# (operation, response key[, linker table]) for each GraphQL call, plus the
+# type-specific profile fields copied into the create input.
+ENTITY_CONFIG = {
+    "Adventurer": {
+        "get": (GET_ADVENTURER_DETAILS_QUERY, "getAdventurer"),
+        "update": (UPDATE_ADVENTURER_MUTATION, "updateAdventurer"),
+        "create": (CREATE_ADVENTURER_MUTATION, "createAdventurer"),
+        "profile_prompt": ADVENTURER_PROFILE_PROMPT_TPL,
+        "profile_model": GeneratedAdventurer,
+        "campaign_link": (CREATE_CAMPAIGN_ADVENTURERS_MUTATION, "createCampaignAdventurers", CAMPAIGN_ADVENTURERS_TABLE),
+        "session_link": (CREATE_SESSION_ADVENTURERS_MUTATION, "createSessionAdventurers", SESSION_ADVENTURERS_TABLE),
+        "session_list": (LIST_SESSION_ADVENTURERS_QUERY, "listSessionAdventurers"),
+        "link_id_field": "adventurerId",
+        "segment_field": "adventurerSegmentsId",
+        # Don't auto-assign class - let users set this manually
+        "profile_fields": ("race",),
+    },
+    "NPC": {
+        "get": (GET_NPC_DETAILS_QUERY, "getNPC"),
+        "update": (UPDATE_NPC_MUTATION, "updateNPC"),
+        "create": (CREATE_NPC_MUTATION, "createNPC"),
+        "profile_prompt": NPC_PROFILE_PROMPT_TPL,
+        "profile_model": GeneratedNPC,
+        "campaign_link": (CREATE_CAMPAIGN_NPCS_MUTATION, "createCampaignNpcs", CAMPAIGN_NPCS_TABLE),
+        "session_link": (CREATE_SESSION_NPCS_MUTATION, "createSessionNpcs", SESSION_NPCS_TABLE),
+        "session_list": (LIST_SESSION_NPCS_QUERY, "listSessionNpcs"),
+        "link_id_field": "nPCId",
+        "segment_field": "nPCSegmentsId",
+        "profile_fields": ("brief", "type", "race"),
+    },
+    "Location": {
+        "get": (GET_LOCATION_DETAILS_QUERY, "getLocation"),
+        "update": (UPDATE_LOCATION_MUTATION, "updateLocation"),
+        "create": (CREATE_LOCATION_MUTATION, "createLocation"),
+        "profile_prompt": LOCATION_PROFILE_PROMPT_TPL,
+        "profile_model": GeneratedLocation,
+        "campaign_link": (CREATE_CAMPAIGN_LOCATIONS_MUTATION, "createCampaignLocations", CAMPAIGN_LOCATIONS_TABLE),
+        "session_link": (CREATE_SESSION_LOCATIONS_MUTATION, "createSessionLocations", SESSION_LOCATIONS_TABLE),
+        "session_list": (LIST_SESSION_LOCATIONS_QUERY, "listSessionLocations"),
+        "link_id_field": "locationId",
+        "segment_field": "locationSegmentsId",
+        # Location schema doesn't have 'brief' or 'type' fields
+        "profile_fields": (),
+    },
+    "LootItem": {
+        "get": (GET_LOOT_ITEM_DETAILS_QUERY, "getLootItem"),
+        "update": (UPDATE_LOOT_ITEM_MUTATION, "updateLootItem"),
+        "create": (CREATE_LOOT_ITEM_MUTATION, "createLootItem"),
+        "profile_prompt": LOOT_ITEM_PROFILE_PROMPT_TPL,
+        "profile_model": GeneratedLootItem,
+        "campaign_link": (CREATE_CAMPAIGN_LOOT_ITEMS_MUTATION, "createCampaignLootItems", CAMPAIGN_LOOT_ITEMS_TABLE),
+        "session_link": (CREATE_SESSION_LOOT_ITEMS_MUTATION, "createSessionLootItems", SESSION_LOOT_ITEMS_TABLE),
+        "session_list": (LIST_SESSION_LOOT_ITEMS_QUERY, "listSessionLootItems"),
+        "link_id_field": "lootItemId",
+        # Segment schema does not have a lootItemSegmentsId field
+        "segment_field": None,
+        "profile_fields": ("type", "quantity"),
+    },
+}
+
+
+# --- AppSync Helper Function ---
+def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Executes a GraphQL query/mutation against AppSync."""
+    headers = {
+        'Content-Type': 'application/json',
+        'x-api-key': APPSYNC_API_KEY_FROM_ENV
+    }
+    payload = {"query": query, "variables": variables or {}}
+
+    try:
+        response = requests.post(APPSYNC_API_URL, headers=headers, json=payload, timeout=90)
+        response.raise_for_status()
+        response_json = response.json()
+        if "errors" in response_json:
+            print(f"GraphQL Error: {json.dumps(response_json['errors'], indent=2)}")
+        return response_json
+    except requests.exceptions.RequestException as e:
+        print(f"Error making AppSync request: {e}")
+        return {"errors": [{"message": str(e)}]}
+
+
+def update_entity_description(entity_id: str, entity_type: str, highlights: List[str], debug: bool = False) -> bool:
+    """Updates an existing entity's description with new highlights using LLM."""
+    if not entity_id or not highlights:
+        return False
+
+    print(f"Updating description for {entity_type} ID: {entity_id}")
+
+    config = ENTITY_CONFIG.get(entity_type)
+    if not config:
+        return False
+    get_query, get_key = config["get"]
+    update_mutation, update_key = config["update"]
+
+    try:
+        response_gql = execute_graphql_request(get_query, {"id": entity_id})
+        entity_data = response_gql.get("data", {}).get(get_key)
+        if not entity_data:
+            return False
+        
+        current_description = entity_data.get("description", "") or "This entity has no description yet."
+        current_version = entity_data["_version"]
+        entity_name = entity_data.get("name", "Unknown")
+
+        highlights_str = "\n".join(f"- {h}" for h in highlights)
+        prompt = DESCRIPTION_UPDATE_PROMPT_TPL.format(
+            name=entity_name, description=current_description, highlights=highlights_str
+        )
+
+        completion = openai_client.chat.completions.create(
+            model="gpt-5.2",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.4,
+        )
+        updated_description = completion.choices[0].message.content.strip()
+
+        if updated_description and updated_description != current_description:
+            update_response = execute_graphql_request(update_mutation, {
+                "input": {"id": entity_id, "description": updated_description, "_version": current_version}
+            })
+            if update_response.get("data", {}).get(update_key):
+                print(f"✅ Updated {entity_type}: {entity_name}")
+                return True
+        return True  # No change needed is still success
+
+    except Exception as e:
+        print(f"Error updating {entity_type} {entity_id}: {e}")
+        return False
+
+
+class UpdateBatcher:
+    """Runs description updates on a worker pool with bounded admission.
+
+    apply() blocks once max_inflight updates are pending, so large sessions get
+    backpressure instead of stampeding AppSync and OpenAI with every update at once.
+    """
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT_UPDATES, debug: bool = False):
+        self._admission = threading.BoundedSemaphore(max_inflight)
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight)
+        self._pending: List[Tuple[str, str, Future]] = []
+        self._debug = debug
+
+    def apply(self, entity_id: str, entity_type: str, highlights: List[str]) -> Future:
+        """Schedules an update, waiting for a free slot if the queue is full."""
+        self._admission.acquire()
+        try:
+            future = self._executor.submit(update_entity_description, entity_id, entity_type, highlights, self._debug)
+        except Exception:
+            self._admission.release()
+            raise
+        future.add_done_callback(lambda _: self._admission.release())
+        self._pending.append((entity_id, entity_type, future))
+        return future
+
+    def close(self) -> None:
+        """Releases the worker pool, cancelling updates that have not started; safe to call twice."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def wait_for_no_pending_requests(self) -> List[Tuple[str, str, bool]]:
+        """Blocks until every scheduled update finishes; returns (id, type, success) in submission order."""
+        self._executor.shutdown(wait=True)
+        results = []
+        for entity_id, entity_type, future in self._pending:
+            try:
+                success = future.result()
+            except Exception as e:
+                print(f"Error in description update for {entity_type} {entity_id}: {e}")
+                success = False
+            results.append((entity_id, entity_type, success))
+        self._pending = []
+        return results
+
+
+def generate_entity_profile(entity_type: str, name: str, highlights: List[str], transcript_context: str = "") -> Optional[Dict]:
+    """Uses LLM to generate a full entity profile for a new entity."""
+    highlights_str = "\n".join(f"- {h}" for h in highlights)
+    
+    config = ENTITY_CONFIG.get(entity_type)
+    if not config:
         return None
+    prompt = config["profile_prompt"].format(
+        name=name,
+        highlights=highlights_str,
+        context=transcript_context[:2000] if transcript_context else "Not provided",
+    )
+    model_class = config["profile_model"]
 
     try:
         completion = openai_client.chat.completions.create(
@@ -566,42 +674,32 @@ def update_linker_table_owner(table_name: str, link_id: str, owner: str) -> bool
         return False
 
 
+def invalidate_campaign_context_cache(campaign_id: str) -> None:
+    """Drops the cached campaign context so the next summary sees newly created entities.
+
+    Linking entities does not bump the campaign's _version, so the cache can't detect this itself.
+    """
+    if not CAMPAIGN_CONTEXT_CACHE_TABLE or not campaign_id:
+        return
+    try:
+        dynamodb_client.delete_item(
+            TableName=CAMPAIGN_CONTEXT_CACHE_TABLE,
+            Key={'id': {'S': f"ctx#{campaign_id}"}}
+        )
+    except Exception as e:
+        print(f"Warning: Failed to invalidate campaign context cache for {campaign_id}: {e}")
+
+
 def create_campaign_entity_link(entity_type: str, entity_id: str, campaign_id: str, owner: str) -> bool:
     """Creates a link record between a campaign and an entity (NPC, Location, or Adventurer)."""
-    if entity_type == "NPC":
-        mutation = CREATE_CAMPAIGN_NPCS_MUTATION
-        create_key = "createCampaignNpcs"
-        table_name = CAMPAIGN_NPCS_TABLE
-        link_input = {
-            "campaignId": campaign_id,
-            "nPCId": entity_id
-        }
-    elif entity_type == "Location":
-        mutation = CREATE_CAMPAIGN_LOCATIONS_MUTATION
-        create_key = "createCampaignLocations"
-        table_name = CAMPAIGN_LOCATIONS_TABLE
-        link_input = {
-            "campaignId": campaign_id,
-            "locationId": entity_id
-        }
-    elif entity_type == "Adventurer":
-        mutation = CREATE_CAMPAIGN_ADVENTURERS_MUTATION
-        create_key = "createCampaignAdventurers"
-        table_name = CAMPAIGN_ADVENTURERS_TABLE
-        link_input = {
-            "campaignId": campaign_id,
-            "adventurerId": entity_id
-        }
-    elif entity_type == "LootItem":
-        mutation = CREATE_CAMPAIGN_LOOT_ITEMS_MUTATION
-        create_key = "createCampaignLootItems"
-        table_name = CAMPAIGN_LOOT_ITEMS_TABLE
-        link_input = {
-            "campaignId": campaign_id,
-            "lootItemId": entity_id
-        }
-    else:
+    config = ENTITY_CONFIG.get(entity_type)
+    if not config:
         return False
+    mutation, create_key, table_name = config["campaign_link"]
+    link_input = {
+        "campaignId": campaign_id,
+        config["link_id_field"]: entity_id
+    }
 
     try:
         response = execute_graphql_request(mutation, {"input": link_input})
@@ -640,19 +738,15 @@ def create_entity_highlight_segment(entity_type: str, entity_id: str, entity_nam
     }
 
     # Set the correct entity link field
-    if entity_type == "Adventurer":
-        segment_input["adventurerSegmentsId"] = entity_id
-    elif entity_type == "NPC":
-        segment_input["nPCSegmentsId"] = entity_id
-    elif entity_type == "Location":
-        segment_input["locationSegmentsId"] = entity_id
-    elif entity_type == "LootItem":
-        # Segment schema does not have a lootItemSegmentsId field; skip segment creation
-        print(f"ℹ️ Skipping highlight segment for LootItem (not supported in Segment schema)")
-        return True
-    else:
+    config = ENTITY_CONFIG.get(entity_type)
+    if not config:
         print(f"Unknown entity type: {entity_type}")
         return False
+    segment_field = config["segment_field"]
+    if not segment_field:
+        print(f"ℹ️ Skipping highlight segment for {entity_type} (not supported in Segment schema)")
+        return True
+    segment_input[segment_field] = entity_id
 
     try:
         response = execute_graphql_request(CREATE_SEGMENT_MUTATION, {"input": segment_input})
@@ -670,24 +764,11 @@ def create_entity_highlight_segment(entity_type: str, entity_id: str, entity_nam
 
 def check_session_link_exists(entity_type: str, entity_id: str, session_id: str) -> bool:
     """Checks if a session-entity link already exists to prevent duplicates."""
-    if entity_type == "NPC":
-        query = LIST_SESSION_NPCS_QUERY
-        list_key = "listSessionNpcs"
-        entity_id_field = "nPCId"
-    elif entity_type == "Location":
-        query = LIST_SESSION_LOCATIONS_QUERY
-        list_key = "listSessionLocations"
-        entity_id_field = "locationId"
-    elif entity_type == "Adventurer":
-        query = LIST_SESSION_ADVENTURERS_QUERY
-        list_key = "listSessionAdventurers"
-        entity_id_field = "adventurerId"
-    elif entity_type == "LootItem":
-        query = LIST_SESSION_LOOT_ITEMS_QUERY
-        list_key = "listSessionLootItems"
-        entity_id_field = "lootItemId"
-    else:
+    config = ENTITY_CONFIG.get(entity_type)
+    if not config:
         return False
+    query, list_key = config["session_list"]
+    entity_id_field = config["link_id_field"]
 
     try:
         # Query for links matching this session
@@ -719,40 +800,14 @@ def create_session_entity_link(entity_type: str, entity_id: str, session_id: str
         print(f"ℹ️ Session{entity_type}s link already exists for entity {entity_id} in session {session_id}")
         return True  # Return True since the link exists (not an error)
 
-    if entity_type == "NPC":
-        mutation = CREATE_SESSION_NPCS_MUTATION
-        create_key = "createSessionNpcs"
-        table_name = SESSION_NPCS_TABLE
-        link_input = {
-            "sessionId": session_id,
-            "nPCId": entity_id
-        }
-    elif entity_type == "Location":
-        mutation = CREATE_SESSION_LOCATIONS_MUTATION
-        create_key = "createSessionLocations"
-        table_name = SESSION_LOCATIONS_TABLE
-        link_input = {
-            "sessionId": session_id,
-            "locationId": entity_id
-        }
-    elif entity_type == "Adventurer":
-        mutation = CREATE_SESSION_ADVENTURERS_MUTATION
-        create_key = "createSessionAdventurers"
-        table_name = SESSION_ADVENTURERS_TABLE
-        link_input = {
-            "sessionId": session_id,
-            "adventurerId": entity_id
-        }
-    elif entity_type == "LootItem":
-        mutation = CREATE_SESSION_LOOT_ITEMS_MUTATION
-        create_key = "createSessionLootItems"
-        table_name = SESSION_LOOT_ITEMS_TABLE
-        link_input = {
-            "sessionId": session_id,
-            "lootItemId": entity_id
-        }
-    else:
+    config = ENTITY_CONFIG.get(entity_type)
+    if not config:
         return False
+    mutation, create_key, table_name = config["session_link"]
+    link_input = {
+        "sessionId": session_id,
+        config["link_id_field"]: entity_id
+    }
 
     try:
         response = execute_graphql_request(mutation, {"input": link_input})
@@ -776,50 +831,22 @@ def create_session_entity_link(entity_type: str, entity_id: str, session_id: str
 
 def create_entity_in_database(entity_type: str, profile: Dict, session_id: str, campaign_id: str, owner: str) -> Optional[str]:
     """Creates a new entity in the database with PENDING approval status and links it to the campaign and session."""
+    config = ENTITY_CONFIG.get(entity_type)
+    if not config:
+        return None
+    mutation, create_key = config["create"]
     generated_at = datetime.utcnow().isoformat() + "Z"
     
-    # Base input fields common to all entity types
-    base_input = {
+    # Base input fields common to all entity types, plus the type-specific profile fields
+    create_input = {
         "name": profile["name"],
         "description": profile.get("description"),
         "approvalStatus": "PENDING",
         "generatedFromSessionId": session_id,
         "generatedAt": generated_at,
         "owner": owner,
+        **{field: profile.get(field) for field in config["profile_fields"]},
     }
-    
-    if entity_type == "NPC":
-        mutation = CREATE_NPC_MUTATION
-        create_key = "createNPC"
-        create_input = {
-            **base_input,
-            "brief": profile.get("brief"),
-            "type": profile.get("type"),
-            "race": profile.get("race"),
-        }
-    elif entity_type == "Location":
-        mutation = CREATE_LOCATION_MUTATION
-        create_key = "createLocation"
-        create_input = base_input.copy()
-        # Location schema doesn't have 'brief' or 'type' fields
-    elif entity_type == "Adventurer":
-        mutation = CREATE_ADVENTURER_MUTATION
-        create_key = "createAdventurer"
-        create_input = {
-            **base_input,
-            "race": profile.get("race"),
-            # Don't auto-assign class - let users set this manually
-        }
-    elif entity_type == "LootItem":
-        mutation = CREATE_LOOT_ITEM_MUTATION
-        create_key = "createLootItem"
-        create_input = {
-            **base_input,
-            "type": profile.get("type"),
-            "quantity": profile.get("quantity"),
-        }
-    else:
-        return None
 
     try:
         # Step 1: Create the entity
@@ -908,41 +935,54 @@ def lambda_handler(event, context):
         errors = []
 
         # --- Update Existing Entities ---
-        # Aggregate highlights by ID and create session links
-        for entity_type, entities, result_key in [
-            ("Adventurer", existing_adventurers, "adventurers"),
-            ("NPC", existing_npcs, "npcs"),
-            ("Location", existing_locations, "locations"),
-            ("LootItem", existing_loot_items, "lootItems")
-        ]:
-            # Build maps: id -> highlights and id -> name
-            highlights_by_id: Dict[str, List[str]] = {}
-            name_by_id: Dict[str, str] = {}
-            for entity in entities:
-                if entity.get("id"):
-                    highlights_by_id.setdefault(entity["id"], []).extend(entity.get("highlights", []))
-                    if entity.get("name"):
-                        name_by_id[entity["id"]] = entity["name"]
-
-            for entity_id, highlights in highlights_by_id.items():
-                unique_highlights = list(dict.fromkeys(highlights))
-                entity_name = name_by_id.get(entity_id, "Unknown")
-
-                if update_entity_description(entity_id, entity_type, unique_highlights, debug):
-                    updated_entities[result_key].append(entity_id)
-                else:
-                    errors.append(f"Failed to update {entity_type} {entity_id}")
-
-                # Create session link for existing entity (records appearance in this session)
-                if session_id:
-                    session_link_success = create_session_entity_link(entity_type, entity_id, session_id, owner)
-                    if not session_link_success:
-                        print(f"⚠️ Failed to create session link for existing {entity_type} {entity_id}")
-
-                # Create highlight segment for existing entity
-                if session_id and unique_highlights:
-                    session_name = event.get("sessionName")
-                    create_entity_highlight_segment(entity_type, entity_id, entity_name, unique_highlights, session_id, session_name, owner)
+        # Aggregate highlights by ID and create session links; description updates
+        # run through the batcher so they overlap with the link/segment writes below
+        batcher = UpdateBatcher(debug=debug)
+        result_key_by_type = {}
+        try:
+            for entity_type, entities, result_key in [
+                ("Adventurer", existing_adventurers, "adventurers"),
+                ("NPC", existing_npcs, "npcs"),
+                ("Location", existing_locations, "locations"),
+                ("LootItem", existing_loot_items, "lootItems")
+            ]:
+                # Build maps: id -> highlights and id -> name
+                highlights_by_id: Dict[str, List[str]] = {}
+                name_by_id: Dict[str, str] = {}
+                for entity in entities:
+                    if entity.get("id"):
+                        highlights_by_id.setdefault(entity["id"], []).extend(entity.get("highlights", []))
+                        if entity.get("name"):
+                            name_by_id[entity["id"]] = entity["name"]
+
+                result_key_by_type[entity_type] = result_key
+                for entity_id, highlights in highlights_by_id.items():
+                    unique_highlights = list(dict.fromkeys(highlights))
+                    entity_name = name_by_id.get(entity_id, "Unknown")
+
+                    batcher.apply(entity_id, entity_type, unique_highlights)
+
+                    # Create session link for existing entity (records appearance in this session)
+                    if session_id:
+                        session_link_success = create_session_entity_link(entity_type, entity_id, session_id, owner)
+                        if not session_link_success:
+                            print(f"⚠️ Failed to create session link for existing {entity_type} {entity_id}")
+
+                    # Create highlight segment for existing entity
+                    if session_id and unique_highlights:
+                        session_name = event.get("sessionName")
+                        create_entity_highlight_segment(entity_type, entity_id, entity_name, unique_highlights, session_id, session_name, owner)
+
+            update_results = batcher.wait_for_no_pending_requests()
+        finally:
+            # Also reached when link/segment writes raise, so the pool never outlives the invocation
+            batcher.close()
+
+        for entity_id, entity_type, success in update_results:
+            if success:
+                updated_entities[result_key_by_type[entity_type]].append(entity_id)
+            else:
+                errors.append(f"Failed to update {entity_type} {entity_id}")
         
         # --- Create New Entities ---
         for entity_type, new_entities, result_key in [
@@ -983,32 +1023,23 @@ def lambda_handler(event, context):
         
         total_created = sum(len(v) for v in created_entities.values())
         total_updated = sum(len(v) for v in updated_entities.values())
+
+        if total_created:
+            invalidate_campaign_context_cache(campaign_id)
         
         print(f"generate-entity-lore completed: {total_created} created, {total_updated} updated")
         
         if errors:
             print(f"⚠️ {len(errors)} errors occurred")
         
-        # Build output
+        # Build output - passthrough all input fields plus results
         output = {
+            **event,
             "statusCode": 200,
             "createdEntities": created_entities,
             "updatedEntities": updated_entities,
             "errors": errors if errors else None,
-            # Passthrough fields
-            "narrativeSummaryS3Key": event.get("narrativeSummaryS3Key"),
-            "sessionId": session_id,
-            "sessionName": event.get("sessionName"),
-            "campaignId": campaign_id,
-            "owner": owner,
-            "bucket": bucket,
-            "transcriptKey": transcript_key,
-            "generateLore": event.get("generateLore"),
-            "generateName": event.get("generateName"),
             "entityMentions": entity_mentions,
-            "imageSettings": event.get("imageSettings"),
-            "userTransactionsTransactionsId": event.get("userTransactionsTransactionsId"),
-            "creditsToRefund": event.get("creditsToRefund")
         }
         
         return output
@@ -1018,13 +1049,9 @@ def lambda_handler(event, context):
         print(f"ERROR: {error_message}")
         traceback.print_exc()
         
+        # Passthrough all input fields for downstream error handling
         return {
+            **event,
             "statusCode": 500,
             "error": error_message,
-            "sessionId": event.get("sessionId"),
-            "userTransactionsTransactionsId": event.get("userTransactionsTransactionsId"),
-            "creditsToRefund": event.get("creditsToRefund"),
-            "narrativeSummaryS3Key": event.get("narrativeSummaryS3Key"),
-            "entityMentions": event.get("entityMentions"),
-            "imageSettings": event.get("imageSettings")
         }
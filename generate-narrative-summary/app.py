@@ -1,17 +1,27 @@
 # --- Standard Library Imports ---
 import os
-import json
+import io
+import gzip
+import time
+import hashlib
+import math
 import urllib.parse
-from typing import List, Optional, Dict, Any
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, Tuple
 import re
 import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Third-party Library Imports ---
-import requests
+import urllib3
 import boto3
-from pydantic import BaseModel, Field
-import openai
-from openai import OpenAI
+import orjson
+from pydantic import BaseModel, Field, TypeAdapter
+from rapidfuzz import fuzz, process, utils as fuzz_utils
+
+# numpy is only needed for embedding matching and is imported where it is used
+if TYPE_CHECKING:
+    import numpy as np
 
 # --- CONFIGURATION ---
 OPENAI_API_KEY_FROM_ENV = os.environ.get('OPENAI_API_KEY')
@@ -19,6 +29,36 @@ APPSYNC_API_URL = os.environ.get('APPSYNC_API_URL')
 APPSYNC_API_KEY_FROM_ENV = os.environ.get('APPSYNC_API_KEY')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-2')
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE')
+NARRATIVE_SUMMARY_MODEL = "gpt-5.2"
+NARRATIVE_CACHE_PREFIX = "cache/narrative/"
+# Optional campaign-context cache; disabled when the table is not configured
+CAMPAIGN_CONTEXT_CACHE_TABLE = os.environ.get('CAMPAIGN_CONTEXT_CACHE_TABLE')
+CAMPAIGN_CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get('CAMPAIGN_CONTEXT_CACHE_TTL_SECONDS', '300'))
+
+# RapidFuzz WRatio thresholds: at or above ACCEPT is a match, below REJECT is a new
+# entity; only names scoring in between are sent to the embedding matcher.
+FUZZY_MATCH_ACCEPT_SCORE = 90
+FUZZY_MATCH_REJECT_SCORE = 50
+
+# Names in the ambiguous fuzzy band are matched by embedding cosine similarity. Candidate
+# embeddings are cached in S3 under a hash of the campaign's names, and per warm container.
+ENTITY_EMBEDDING_MODEL = "text-embedding-3-small"
+ENTITY_EMBEDDING_DIMENSIONS = 256
+ENTITY_EMBEDDING_CACHE_PREFIX = "cache/entity-embeddings/"
+EMBEDDING_MATCH_THRESHOLD = float(os.environ.get('EMBEDDING_MATCH_THRESHOLD', '0.7'))
+
+# Transcripts longer than the threshold are cut down to the highest-signal blocks before
+# prompting. Tokens are estimated at ~4 characters each (no tokenizer in the layer).
+TRANSCRIPT_PREFILTER_THRESHOLD_CHARS = int(os.environ.get('TRANSCRIPT_PREFILTER_THRESHOLD_CHARS', '100000'))
+TRANSCRIPT_TOKEN_BUDGET = int(os.environ.get('TRANSCRIPT_TOKEN_BUDGET', '25000'))
+TRANSCRIPT_BLOCK_CHARS = 1500
+TRANSCRIPT_ENTITY_WEIGHT = 2.0
+WORD_RE = re.compile(r"[a-z][a-z']+")
+SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?])\s+")
+
+# --- Filename Patterns (compiled once per container) ---
+SESSION_ID_RE = re.compile(r"Session([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})")
+METADATA_STEM_RE = re.compile(r"(campaign[0-9a-fA-F-]+Session[0-9a-fA-F-]+)")
 
 # --- VALIDATE ESSENTIAL CONFIGURATION ---
 if not OPENAI_API_KEY_FROM_ENV:
@@ -33,7 +73,14 @@ if not DYNAMODB_TABLE_NAME:
 # --- AWS & OPENAI CLIENTS ---
 s3_client = boto3.client("s3", region_name=AWS_REGION)
 dynamodb_resource = boto3.resource('dynamodb', region_name=AWS_REGION)
-openai_client = OpenAI(api_key=OPENAI_API_KEY_FROM_ENV)
+# The OpenAI SDK is the heaviest import in this module; it is loaded on first use
+# so cold starts that never reach the LLM (cache hits, bad events) skip it
+_openai_client = None
+_candidate_embeddings_memo: Dict[str, "np.ndarray"] = {}
+
+# Shared keep-alive pool for AppSync so warm invocations and the parallel campaign
+# fetches reuse TCP/TLS connections instead of handshaking per request
+appsync_http = urllib3.PoolManager(num_pools=1, maxsize=8, retries=urllib3.Retry(total=2, backoff_factor=0.2))
 
 # --- Pydantic Data Models ---
 class SegmentElement(BaseModel):
@@ -57,6 +104,36 @@ class NarrativeSummary(BaseModel):
     npcHighlights: List[HighlightElement] = Field(description="Highlights for NPCs.")
     lootItemHighlights: List[HighlightElement] = Field(default_factory=list, description="Highlights for loot items.")
 
+
+def make_strict_json_schema(schema: Any) -> Any:
+    """Adapts a Pydantic JSON schema to OpenAI strict structured outputs.
+
+    Strict mode requires every property to be listed as required, no additional
+    properties, and no defaults (optional fields stay nullable via anyOf).
+    """
+    if isinstance(schema, list):
+        return [make_strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    strict = {key: make_strict_json_schema(value) for key, value in schema.items() if key != "default"}
+    if strict.get("type") == "object" and isinstance(strict.get("properties"), dict):
+        strict["required"] = list(strict["properties"].keys())
+        strict["additionalProperties"] = False
+    return strict
+
+
+# Built once per container: the validator for LLM responses and the matching
+# structured-output response_format sent with every request
+NARRATIVE_SUMMARY_ADAPTER = TypeAdapter(NarrativeSummary)
+NARRATIVE_SUMMARY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "NarrativeSummary",
+        "schema": make_strict_json_schema(NARRATIVE_SUMMARY_ADAPTER.json_schema()),
+        "strict": True,
+    },
+}
+
 # --- Lookup Tables ---
 image_quality_lookup = {
     "Low quality": "low",
@@ -64,6 +141,8 @@ image_quality_lookup = {
     "High quality": "high"
 }
 
+# longDescription values are sent on as imageSettings.stylePrompt and must match
+# generate-segment-images/app.py exactly, which recognizes them as known styles
 image_format_lookup = {
     "fantasy": {
         "name": "Default",
@@ -123,6 +202,10 @@ image_format_lookup = {
     }
 }
 
+# Flattened style key -> prompt text, so the handler does one lookup per style
+IMAGE_STYLE_DESCRIPTION = {style_key: style["longDescription"] for style_key, style in image_format_lookup.items()}
+DEFAULT_IMAGE_STYLE_PROMPT = IMAGE_STYLE_DESCRIPTION["fantasy"]
+
 example_summary = """
 {
   "tldr": "The adventurers navigated the treacherous Sunken City, defeated a kraken cultist leader, and recovered the Tidejewel.",
@@ -169,8 +252,46 @@ example_summary = """
 }
 """
 
+# Static instructions sent as the system message. Keeping this identical across
+# invocations (and first in the request) lets OpenAI's automatic prompt caching
+# reuse it; everything session-specific goes in the user message.
+NARRATIVE_SYSTEM_PROMPT = """You are Scribe, an AI assistant that summarizes TTRPG sessions.
+Generate a JSON object containing a TLDR, chronological session segments, and highlights for adventurers, locations, and NPCs.
+Follow the <generation_instructions> and <user_instructions> provided with each session.
+
+<entity_classification_rules>
+IMPORTANT: Be strict about classifying entities correctly.
+
+ADVENTURERS are ONLY the Player Characters (PCs) - the characters controlled by players at the table. Signs of an adventurer:
+- Players speak in first person as this character ("I attack the goblin")
+- The DM/GM addresses a player by this character's name
+- Listed in the provided adventurer_context
+- Only add NEW adventurers if you are highly confident a player is controlling them
+
+NPCs are ALL other characters, including:
+- Allies and companions who travel with the party (even if they fight alongside the party)
+- Quest givers, shopkeepers, innkeepers
+- Villains, enemies, monsters with names
+- Any character the DM/GM voices or controls
+- When in doubt, classify as NPC rather than adventurer
+</entity_classification_rules>
+
+Output a JSON object with:
+- `tldr`: A string summary of the whole session.
+- `sessionName`: A generated title (3-7 words) or null.
+- `sessionSegments`: A list of 3-5 chronological segments, each with 'title', 'description', 'image_prompt'.
+- `adventurerHighlights`, `locationHighlights`, `npcHighlights`, `lootItemHighlights`: Lists with 'name', 'highlights' (list of strings), 'id' (null), 'is_new' (boolean - true if entity is NOT in the provided campaign context).
+
+For `lootItemHighlights`: include notable items that were found, received, used, or discussed during the session (weapons, armor, potions, treasures, magic items, etc.). Only include items that are meaningfully mentioned, not every minor consumable.
+
+Mark entities as is_new=true if they appear in the transcript but are NOT listed in the provided campaign context.
+When matching names to existing entities, account for audio transcription errors causing phonetic misspellings (e.g., "Gorn" might actually be "Gron").
+
+Example Output:
+""" + example_summary
+
 # --- GraphQL Queries ---
-GET_SESSION_QUERY = "query GetSession($id: ID!) { getSession(id: $id) { id _version audioFile owner campaign { id } } }"
+GET_SESSION_QUERY = "query GetSession($id: ID!) { getSession(id: $id) { id _version audioFile owner campaign { id _version } } }"
 
 GET_NPCS_BY_CAMPAIGN_QUERY = """
 query CampaignNpcsByCampaignId($campaignId: ID!, $limit: Int, $nextToken: String) {
@@ -208,6 +329,47 @@ query CampaignLootItemsByCampaignId($campaignId: ID!, $limit: Int, $nextToken: S
 }
 """
 
+# First page of all four campaign entity lists in a single round trip (aliased);
+# fetch_campaign_data only pages further for lists that return a nextToken.
+CAMPAIGN_CONTEXT_QUERY = """
+query CampaignContext($campaignId: ID!, $limit: Int) {
+  Npcs: campaignNpcsByCampaignId(campaignId: $campaignId, filter: {_deleted: {ne: true}}, limit: $limit) {
+    items { nPC { id name } }
+    nextToken
+  }
+  Adventurers: campaignAdventurersByCampaignId(campaignId: $campaignId, filter: {_deleted: {ne: true}}, limit: $limit) {
+    items { adventurer { id name } }
+    nextToken
+  }
+  Locations: campaignLocationsByCampaignId(campaignId: $campaignId, filter: {_deleted: {ne: true}}, limit: $limit) {
+    items { location { id name } }
+    nextToken
+  }
+  LootItems: campaignLootItemsByCampaignId(campaignId: $campaignId, filter: {_deleted: {ne: true}}, limit: $limit) {
+    items { lootItem { id name } }
+    nextToken
+  }
+}
+"""
+
+# (data_key, paginated query, linked item key) for each campaign entity list
+CAMPAIGN_ENTITY_QUERIES = [
+    ('Npcs', GET_NPCS_BY_CAMPAIGN_QUERY, 'nPC'),
+    ('Adventurers', GET_ADVENTURERS_BY_CAMPAIGN_QUERY, 'adventurer'),
+    ('Locations', GET_LOCATIONS_BY_CAMPAIGN_QUERY, 'location'),
+    ('LootItems', GET_LOOT_ITEMS_BY_CAMPAIGN_QUERY, 'lootItem'),
+]
+
+
+# --- Client Helpers ---
+def get_openai_client():
+    """Returns the shared OpenAI client, importing the SDK on first use."""
+    global _openai_client
+    if _openai_client is None:
+        from openai import OpenAI
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY_FROM_ENV)
+    return _openai_client
+
 
 # --- AppSync Helper Function ---
 def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -219,114 +381,372 @@ def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = No
     payload = {"query": query, "variables": variables or {}}
 
     try:
-        response = requests.post(APPSYNC_API_URL, headers=headers, json=payload, timeout=90)
-        response.raise_for_status()
-        response_json = response.json()
+        response = appsync_http.request('POST', APPSYNC_API_URL, body=orjson.dumps(payload), headers=headers, timeout=90.0)
+        if response.status >= 400:
+            raise urllib3.exceptions.HTTPError(f"{response.status} Error for url: {APPSYNC_API_URL}")
+        response_json = orjson.loads(response.data)
         if "errors" in response_json:
-            print(f"GraphQL Error: {json.dumps(response_json['errors'], indent=2)}")
+            print(f"GraphQL Error: {orjson.dumps(response_json['errors'], option=orjson.OPT_INDENT_2).decode('utf-8')}")
         return response_json
-    except requests.exceptions.RequestException as e:
+    except (urllib3.exceptions.HTTPError, orjson.JSONDecodeError) as e:
         print(f"Error making AppSync request: {e}")
         return {"errors": [{"message": str(e)}]}
 
 
 def parse_session_id_from_stem(filename_stem: str) -> Optional[str]:
     """Parses the Session UUID from a filename stem."""
-    match = re.search(r"Session([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})", filename_stem)
+    match = SESSION_ID_RE.search(filename_stem)
     return match.group(1) if match else None
 
 
-def fetch_campaign_data(campaign_id: str, query: str, data_key: str, item_key: str, debug: bool = False):
-    """Fetches paginated campaign data (NPCs, Adventurers, Locations)."""
+def fetch_campaign_data(campaign_id: str, query: str, data_key: str, item_key: str, debug: bool = False,
+                        first_page: Optional[Dict[str, Any]] = None):
+    """Fetches paginated campaign data (NPCs, Adventurers, Locations).
+
+    If first_page is given (from CAMPAIGN_CONTEXT_QUERY), pagination resumes from its nextToken.
+    Returns (entity_index, context_string, complete); entity_index holds the name lookups used
+    for ID mapping, built once here rather than per highlight list. complete is False when a
+    page failed or max_pages cut pagination short, so the result must not be cached.
+    """
     if not campaign_id:
-        return [], f"No {item_key} context available from campaign."
+        return build_entity_index({}), f"No {item_key} context available from campaign.", True
     
-    print(f"Fetching {data_key} for Campaign ID: {campaign_id}")
     all_items, next_token, pages_queried, max_pages = [], None, 0, 25
+    complete = True
+    if first_page is not None:
+        if not first_page.get("items") and not first_page.get("nextToken"):
+            return build_entity_index({}), f"No {data_key} found for this campaign.", True
+        all_items.extend(item for item in first_page.get("items", []) if item is not None)
+        next_token = first_page.get("nextToken")
+        pages_queried = 1
+        if next_token:
+            print(f"Fetching remaining {data_key} for Campaign ID: {campaign_id}")
+    else:
+        print(f"Fetching {data_key} for Campaign ID: {campaign_id}")
     
-    while pages_queried < max_pages:
+    while pages_queried < max_pages and (pages_queried == 0 or next_token):
         pages_queried += 1
         query_vars = {"campaignId": campaign_id, "limit": 50, "nextToken": next_token}
         response_gql = execute_graphql_request(query, query_vars)
         
-        if "errors" in response_gql and not response_gql.get("data"):
-            print(f"Warning: GraphQL error during Get{data_key}: {response_gql['errors']}")
-            break
+        if "errors" in response_gql:
+            complete = False
+            if not response_gql.get("data"):
+                print(f"Warning: GraphQL error during Get{data_key}: {response_gql['errors']}")
+                break
             
         data = (response_gql.get("data") or {}).get(f"campaign{data_key}ByCampaignId") or {}
         all_items.extend(item for item in data.get("items", []) if item is not None)
         next_token = data.get("nextToken")
         if not next_token:
             break
+    if complete and next_token:
+        print(f"Warning: stopped paging {data_key} after {max_pages} pages")
+        complete = False
     
     details = []
+    name_to_id_map = {}
+    original_case_map = {}
     for item in all_items:
-        if item.get(item_key):
-            name = item.get(item_key, {}).get('name', f'Unknown {item_key}')
-            item_id = item.get(item_key, {}).get('id')
-            details.append(f"- {name} (ID: {item_id})")
+        entity = item.get(item_key)
+        if not entity:
+            continue
+        name = entity.get('name')
+        item_id = entity.get('id')
+        details.append(f"- {name or f'Unknown {item_key}'} (ID: {item_id})")
+        if name and item_id:
+            name_to_id_map[name.lower()] = item_id
+            original_case_map[name.lower()] = name
 
     context_string = f"Relevant {data_key} in this campaign:\n" + "\n".join(details) if details else f"No {data_key} found for this campaign."
-    return all_items, context_string
+    return build_entity_index(name_to_id_map, list(original_case_map.values())), context_string, complete
+
+
+def build_entity_index(name_to_id_map: Dict[str, str], canonical_names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Bundles the lowercase name -> ID map with the canonical names used for fuzzy and embedding matching."""
+    return {
+        "nameToId": name_to_id_map,
+        "names": canonical_names or [],
+    }
+
+
+def read_s3_text(s3_bucket: str, key: str, chunk_size: int = 1 << 20) -> str:
+    """Reads a UTF-8 S3 object by streaming it into a buffer preallocated from ContentLength."""
+    s3_obj = s3_client.get_object(Bucket=s3_bucket, Key=key)
+    buffer = bytearray(s3_obj.get('ContentLength') or 0)
+    view = memoryview(buffer)
+    offset = 0
+    for chunk in s3_obj['Body'].iter_chunks(chunk_size=chunk_size):
+        end = offset + len(chunk)
+        if end > len(buffer):
+            # ContentLength missing or wrong - fall back to growing the buffer
+            view.release()
+            buffer[offset:] = chunk
+            view = memoryview(buffer)
+        else:
+            view[offset:end] = chunk
+        offset = end
+    view.release()
+    del buffer[offset:]
+    return buffer.decode('utf-8')
+
+
+def load_session_metadata(s3_bucket: str, metadata_s3_key: str) -> Optional[Dict[str, Any]]:
+    """Loads the session metadata JSON, or returns None when it is missing or unreadable."""
+    try:
+        metadata_obj = s3_client.get_object(Bucket=s3_bucket, Key=metadata_s3_key)
+        metadata_content = orjson.loads(metadata_obj['Body'].read())
+        print("Metadata loaded successfully")
+        return metadata_content
+    except s3_client.exceptions.NoSuchKey:
+        print("Warning: Metadata file not found. Using defaults.")
+    except Exception as e:
+        print(f"Warning: Error fetching metadata: {e}")
+    return None
 
 
-def llm_match_entity(query_name: str, candidate_names: List[str], entity_type: str, debug: bool = False) -> Optional[str]:
-    """Uses LLM to intelligently match an entity name to candidates."""
-    if not candidate_names:
+def get_cached_campaign_context(campaign_id: str, campaign_version: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Returns the cached campaign context if it is unexpired and matches the campaign's current _version."""
+    if not CAMPAIGN_CONTEXT_CACHE_TABLE or not campaign_id:
+        return None
+    try:
+        cache_table = dynamodb_resource.Table(CAMPAIGN_CONTEXT_CACHE_TABLE)
+        item = cache_table.get_item(Key={'id': f"ctx#{campaign_id}"}).get('Item')
+        # DynamoDB TTL deletion is lazy, so check expiry here as well
+        if not item or item.get('campaignVersion') != campaign_version or item.get('ttl', 0) < time.time():
+            return None
+        return orjson.loads(gzip.decompress(item['payload'].value))
+    except Exception as e:
+        print(f"Warning: Error reading campaign context cache: {e}")
         return None
 
-    candidates_list = "\n".join(f"- {name}" for name in candidate_names)
-    prompt = f"""You are helping match entity names in a TTRPG session summary.
 
-Task: Determine if "{query_name}" refers to any of these known {entity_type}s:
-{candidates_list}
+def put_cached_campaign_context(campaign_id: str, campaign_version: Optional[int], campaign_context: Dict[str, Any]) -> None:
+    """Stores the fetched campaign context as gzipped JSON with a short TTL."""
+    if not CAMPAIGN_CONTEXT_CACHE_TABLE or not campaign_id:
+        return
+    try:
+        cache_table = dynamodb_resource.Table(CAMPAIGN_CONTEXT_CACHE_TABLE)
+        cache_table.put_item(Item={
+            'id': f"ctx#{campaign_id}",
+            'campaignVersion': campaign_version,
+            'ttl': int(time.time()) + CAMPAIGN_CONTEXT_CACHE_TTL_SECONDS,
+            'payload': gzip.compress(orjson.dumps(campaign_context))
+        })
+    except Exception as e:
+        print(f"Warning: Error writing campaign context cache: {e}")
+
 
-Rules:
-1. Return ONLY the exact matching name from the list above, or "NO_MATCH" if none match
-2. PREFER matching to existing entities when possible - audio transcription often causes errors like:
-   - Phonetically similar names (e.g., "Gorn" vs "Gron", "Tharivol" vs "Tharivoal")
-   - Added/missing titles or epithets (e.g., "Gron" vs "Gron son of Gwoin")
-   - Minor spelling variations (e.g., "Aelindra" vs "Alindra")
-3. Consider nicknames, shortened names, and full names as potential matches
-4. Only return "NO_MATCH" if the name is clearly a different entity entirely
+def get_cached_summary_json(s3_bucket: str, cache_key: str) -> Optional[str]:
+    """Returns a previously generated LLM response for this prompt, if one was cached."""
+    try:
+        cached_obj = s3_client.get_object(Bucket=s3_bucket, Key=f"{NARRATIVE_CACHE_PREFIX}{cache_key}.json")
+        return cached_obj['Body'].read().decode('utf-8')
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    except Exception as e:
+        print(f"Warning: Error reading summary cache: {e}")
+        return None
 
-Response (one line only):"""
 
+def put_cached_summary_json(s3_bucket: str, cache_key: str, json_content: str) -> None:
+    """Stores the raw LLM response so retries and re-runs of the same prompt skip the LLM call."""
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_completion_tokens=50
+        s3_client.put_object(
+            Bucket=s3_bucket,
+            Key=f"{NARRATIVE_CACHE_PREFIX}{cache_key}.json",
+            Body=json_content,
+            ContentType='application/json'
         )
-        result = response.choices[0].message.content.strip()
-        
-        if result == "NO_MATCH":
-            return None
-        if result in candidate_names:
-            return result
+    except Exception as e:
+        print(f"Warning: Error writing summary cache: {e}")
+
+
+def condense_transcript(transcript_text: str, entity_names: List[str], token_budget: int = TRANSCRIPT_TOKEN_BUDGET) -> str:
+    """Extractively shortens a long transcript to fit a token budget.
+
+    The transcript is split into blocks of whole lines; lines longer than a block (faster-whisper
+    output is a single line) are first broken into sentences, or fixed-size pieces where a
+    sentence is itself too long. Each block is scored by how many
+    known campaign entities it mentions plus the mean IDF of its words, so scenes that
+    introduce new vocabulary outrank repeated table chatter. The best blocks are kept in
+    their original order, with gaps marked by "[...]".
+    """
+    char_budget = token_budget * 4
+    if len(transcript_text) <= char_budget:
+        return transcript_text
+
+    blocks, current = [], ""
+    for line in transcript_text.splitlines():
+        pieces = [line]
+        if len(line) > TRANSCRIPT_BLOCK_CHARS:
+            pieces = []
+            for sentence in SENTENCE_BREAK_RE.split(line):
+                pieces.extend(sentence[i:i + TRANSCRIPT_BLOCK_CHARS] for i in range(0, len(sentence), TRANSCRIPT_BLOCK_CHARS))
+        for piece_idx, piece in enumerate(pieces):
+            if current:
+                # Pieces of the same line are rejoined with a space, separate lines with a newline
+                current += (" " if piece_idx else "\n") + piece
+            else:
+                current = piece
+            if len(current) >= TRANSCRIPT_BLOCK_CHARS:
+                blocks.append(current)
+                current = ""
+    if current:
+        blocks.append(current)
+
+    lowered_names = [name.lower() for name in entity_names if name]
+    block_words = []
+    doc_freq = Counter()
+    for block in blocks:
+        words = set(WORD_RE.findall(block.lower()))
+        block_words.append(words)
+        doc_freq.update(words)
+
+    num_blocks = len(blocks)
+    scores = []
+    for idx, block in enumerate(blocks):
+        block_lower = block.lower()
+        entity_hits = sum(1 for name in lowered_names if name in block_lower)
+        words = block_words[idx]
+        novelty = sum(math.log(num_blocks / doc_freq[word]) for word in words) / len(words) if words else 0.0
+        scores.append(entity_hits * TRANSCRIPT_ENTITY_WEIGHT + novelty)
+
+    kept, used = [], 0
+    for idx in sorted(range(num_blocks), key=scores.__getitem__, reverse=True):
+        block_len = len(blocks[idx]) + 1
+        if used + block_len > char_budget:
+            continue
+        kept.append(idx)
+        used += block_len
+
+    if not kept:
+        # No block fits the budget on its own; fall back to the opening of the session
+        return transcript_text[:char_budget] + "\n[...]"
+
+    parts, previous = [], -1
+    for idx in sorted(kept):
+        if idx != previous + 1:
+            parts.append("[...]")
+        parts.append(blocks[idx])
+        previous = idx
+    if previous != num_blocks - 1:
+        parts.append("[...]")
+    return "\n".join(parts)
+
+
+def embed_names(names: List[str]) -> "np.ndarray":
+    """Embeds names in one API call and returns unit-length float32 vectors, one row per name."""
+    import numpy as np
+    response = get_openai_client().embeddings.create(
+        model=ENTITY_EMBEDDING_MODEL,
+        input=names,
+        dimensions=ENTITY_EMBEDDING_DIMENSIONS,
+    )
+    vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def candidate_embedding_cache_key(campaign_id: Optional[str], candidate_names: List[str]) -> str:
+    """Builds the S3 key for a candidate list's embeddings; any change to the names yields a new key."""
+    names_hash = hashlib.sha256("\n".join([ENTITY_EMBEDDING_MODEL, str(ENTITY_EMBEDDING_DIMENSIONS), *candidate_names]).encode('utf-8')).hexdigest()
+    return f"{ENTITY_EMBEDDING_CACHE_PREFIX}{campaign_id or 'none'}/{names_hash}.npy"
+
+
+def get_cached_candidate_embeddings(s3_bucket: str, cache_key: str) -> Optional["np.ndarray"]:
+    """Returns cached candidate embeddings from the container or S3, or None on a miss."""
+    if cache_key in _candidate_embeddings_memo:
+        return _candidate_embeddings_memo[cache_key]
+    import numpy as np
+    try:
+        cached_obj = s3_client.get_object(Bucket=s3_bucket, Key=cache_key)
+        vectors = np.load(io.BytesIO(cached_obj['Body'].read()), allow_pickle=False)
+        _candidate_embeddings_memo[cache_key] = vectors
+        return vectors
+    except s3_client.exceptions.NoSuchKey:
         return None
     except Exception as e:
-        print(f"Error in LLM entity matching: {e}")
+        print(f"Warning: Error reading entity embedding cache: {e}")
         return None
 
 
-def map_ids_to_highlights(highlights: List[HighlightElement], authoritative_entities: List[Dict], 
-                          entity_key: str, debug: bool = False):
-    """Maps entity IDs to highlights and marks new entities."""
-    name_to_id_map = {}
-    original_case_map = {}
-    
-    for entity in authoritative_entities:
-        if entity is None:
-            continue
-        name = entity.get('name') or (entity.get(entity_key) or {}).get('name', '')
-        entity_id = entity.get('id') or (entity.get(entity_key) or {}).get('id')
-        if name and entity_id:
-            name_to_id_map[name.lower()] = entity_id
-            original_case_map[name.lower()] = name
+def put_cached_candidate_embeddings(s3_bucket: str, cache_key: str, vectors: "np.ndarray") -> None:
+    """Stores candidate embeddings in the container and in S3 as a .npy blob."""
+    import numpy as np
+    _candidate_embeddings_memo[cache_key] = vectors
+    try:
+        buffer = io.BytesIO()
+        np.save(buffer, vectors, allow_pickle=False)
+        s3_client.put_object(Bucket=s3_bucket, Key=cache_key, Body=buffer.getvalue(), ContentType='application/octet-stream')
+    except Exception as e:
+        print(f"Warning: Error writing entity embedding cache: {e}")
+
 
-    canonical_names = list(original_case_map.values())
+def match_highlights_by_embedding(ambiguous_groups: List[Tuple[List[HighlightElement], Dict[str, Any], str]],
+                                  s3_bucket: str, campaign_id: Optional[str], debug: bool = False):
+    """Resolves highlights left ambiguous by fuzzy matching using name-embedding cosine similarity.
 
+    ambiguous_groups holds (highlights, entity_index, entity_key) per entity type. All query
+    names, plus any candidate lists missing from the cache, are embedded in a single request.
+    Highlights below EMBEDDING_MATCH_THRESHOLD are marked as new entities.
+    """
+    if not ambiguous_groups:
+        return
+    import numpy as np
+
+    query_names = list(dict.fromkeys(h.name for unmatched, _, _ in ambiguous_groups for h in unmatched))
+    candidate_vectors = {}
+    missing = []
+    for _, entity_index, entity_key in ambiguous_groups:
+        cache_key = candidate_embedding_cache_key(campaign_id, entity_index["names"])
+        vectors = get_cached_candidate_embeddings(s3_bucket, cache_key)
+        if vectors is None or len(vectors) != len(entity_index["names"]):
+            missing.append((entity_key, entity_index["names"], cache_key))
+        else:
+            candidate_vectors[entity_key] = vectors
+
+    query_vectors = {}
+    try:
+        all_vectors = embed_names(query_names + [name for _, names, _ in missing for name in names])
+        query_vectors = dict(zip(query_names, all_vectors[:len(query_names)]))
+        offset = len(query_names)
+        for entity_key, names, cache_key in missing:
+            candidate_vectors[entity_key] = all_vectors[offset:offset + len(names)]
+            offset += len(names)
+            put_cached_candidate_embeddings(s3_bucket, cache_key, candidate_vectors[entity_key])
+    except Exception as e:
+        print(f"Error embedding entity names: {e}")
+
+    for unmatched, entity_index, entity_key in ambiguous_groups:
+        vectors = candidate_vectors.get(entity_key)
+        for highlight in unmatched:
+            query_vector = query_vectors.get(highlight.name)
+            if vectors is not None and query_vector is not None:
+                similarities = vectors @ query_vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= EMBEDDING_MATCH_THRESHOLD:
+                    matched_name = entity_index["names"][best]
+                    highlight.id = entity_index["nameToId"][matched_name.lower()]
+                    print(f"✅ Embedding match: '{highlight.name}' → '{matched_name}' (ID: {highlight.id}, similarity {similarities[best]:.2f})")
+                    continue
+
+            # No match - mark as new entity
+            highlight.is_new = True
+            print(f"🆕 New entity: '{highlight.name}' (no match found)")
+
+
+def map_ids_to_highlights(highlights: List[HighlightElement], entity_index: Dict[str, Any],
+                          entity_key: str, debug: bool = False) -> List[HighlightElement]:
+    """Maps entity IDs to highlights and marks new entities.
+
+    Returns the highlights whose fuzzy score fell in the ambiguous band, for
+    match_highlights_by_embedding to resolve.
+    """
+    name_to_id_map = entity_index["nameToId"]
+    canonical_names = entity_index["names"]
+
+    unmatched = []
     for highlight in highlights:
         highlight.id = None
         highlight.is_new = False
@@ -338,18 +758,21 @@ def map_ids_to_highlights(highlights: List[HighlightElement], authoritative_enti
             print(f"✅ Direct match: '{highlight.name}' → ID '{highlight.id}'")
             continue
 
-        # LLM fuzzy match
-        matched_name = llm_match_entity(highlight.name, canonical_names, entity_key, debug)
-        if matched_name:
-            matched_id = name_to_id_map.get(matched_name.lower())
-            if matched_id:
-                highlight.id = matched_id
-                print(f"✅ LLM match: '{highlight.name}' → '{matched_name}' (ID: {matched_id})")
-                continue
+        # Deterministic fuzzy match - only ambiguous scores fall through to embeddings
+        best = process.extractOne(highlight.name, canonical_names, scorer=fuzz.WRatio,
+                                  processor=fuzz_utils.default_process)
+        score = best[1] if best else 0
+        if score >= FUZZY_MATCH_ACCEPT_SCORE:
+            highlight.id = name_to_id_map[best[0].lower()]
+            print(f"✅ Fuzzy match: '{highlight.name}' → '{best[0]}' (ID: {highlight.id}, score {score:.0f})")
+            continue
+        if score < FUZZY_MATCH_REJECT_SCORE:
+            highlight.is_new = True
+            print(f"🆕 New entity: '{highlight.name}' (best fuzzy score {score:.0f})")
+            continue
+        unmatched.append(highlight)
 
-        # No match - mark as new entity
-        highlight.is_new = True
-        print(f"🆕 New entity: '{highlight.name}' (no match found)")
+    return unmatched
 
 
 # --- Lambda Handler ---
@@ -376,7 +799,7 @@ def lambda_handler(event, context):
         original_filename = os.path.basename(key)
         filename_stem = os.path.splitext(original_filename)[0]
         
-        metadata_stem_match = re.match(r"(campaign[0-9a-fA-F-]+Session[0-9a-fA-F-]+)", filename_stem)
+        metadata_stem_match = METADATA_STEM_RE.match(filename_stem)
         filename_stem_for_metadata = metadata_stem_match.group(1) if metadata_stem_match else filename_stem
 
         # Parse session ID
@@ -384,9 +807,17 @@ def lambda_handler(event, context):
         if not parsed_session_id:
             raise ValueError(f"Could not parse Session ID from: '{filename_stem}'")
 
-        # Fetch session from AppSync
-        print(f"Fetching session: {parsed_session_id}")
-        session_response = execute_graphql_request(GET_SESSION_QUERY, {"id": parsed_session_id})
+        # The session lookup, metadata and transcript reads are independent, so all three
+        # round trips are started together and each result is consumed where it is needed
+        metadata_s3_key = f"public/session-metadata/{filename_stem_for_metadata}.metadata.json"
+        print(f"Fetching session {parsed_session_id}, metadata and transcript")
+        io_executor = ThreadPoolExecutor(max_workers=4)
+        session_future = io_executor.submit(execute_graphql_request, GET_SESSION_QUERY, {"id": parsed_session_id})
+        metadata_future = io_executor.submit(load_session_metadata, s3_bucket, metadata_s3_key)
+        transcript_future = io_executor.submit(read_s3_text, s3_bucket, key)
+        io_executor.shutdown(wait=False)
+
+        session_response = session_future.result()
         
         if "errors" in session_response and not session_response.get("data"):
             raise Exception(f"Error fetching session: {session_response['errors']}")
@@ -397,6 +828,7 @@ def lambda_handler(event, context):
 
         session_id = session_info["id"]
         campaign_id = session_info.get("campaign", {}).get("id")
+        campaign_version = session_info.get("campaign", {}).get("_version")
 
         # Get owner from DynamoDB
         owner = None
@@ -408,10 +840,7 @@ def lambda_handler(event, context):
         except Exception as e:
             print(f"Warning: Error fetching owner from DynamoDB: {e}")
 
-        # --- Fetch Session Metadata ---
-        print("Fetching session metadata")
-        metadata_s3_key = f"public/session-metadata/{filename_stem_for_metadata}.metadata.json"
-        
+        # --- Apply Session Metadata ---
         # Defaults
         gen_content_length_str = "Segment length should be 4-5 sentences."
         gen_content_style_str = "Write in a balanced, narrative style."
@@ -423,79 +852,109 @@ def lambda_handler(event, context):
         
         img_enabled = True
         img_quality = 'medium'
-        img_style_prompt = image_format_lookup["fantasy"]["longDescription"]
+        img_style_prompt = DEFAULT_IMAGE_STYLE_PROMPT
         
         generate_lore = False
         generate_name = False
 
-        try:
-            metadata_obj = s3_client.get_object(Bucket=s3_bucket, Key=metadata_s3_key)
-            metadata_content = json.loads(metadata_obj['Body'].read().decode('utf-8'))
-            print("Metadata loaded successfully")
-
-            # Parse generation instructions
-            gen_instructions = metadata_content.get("generation_instructions", {})
-            if gen_instructions:
-                length_val = gen_instructions.get("contentLength", 0.5)
-                if length_val < 0.33:
-                    gen_content_length_str = "Each segment should be short and concise, around 2-4 sentences."
-                elif length_val > 0.66:
-                    gen_content_length_str = "Each segment should be highly detailed, around 6-8 sentences."
+        metadata_content = metadata_future.result()
+        if metadata_content:
+            try:
+                # Parse generation instructions
+                gen_instructions = metadata_content.get("generation_instructions", {})
+                if gen_instructions:
+                    length_val = gen_instructions.get("contentLength", 0.5)
+                    if length_val < 0.33:
+                        gen_content_length_str = "Each segment should be short and concise, around 2-4 sentences."
+                    elif length_val > 0.66:
+                        gen_content_length_str = "Each segment should be highly detailed, around 6-8 sentences."
                 
-                style_val = gen_instructions.get("contentStyle", 0.5)
-                if style_val < 0.33:
-                    gen_content_style_str = "Write in a direct, factual, to-the-point style."
-                elif style_val > 0.66:
-                    gen_content_style_str = "Write in a highly narrative, descriptive, and dramatic manner."
-
-                tones = gen_instructions.get("selectedTones")
-                if tones and isinstance(tones, list):
-                    gen_tones_str = f"Adopt the following tones: {', '.join(tones)}."
-
-                emphases = gen_instructions.get("selectedEmphases")
-                if emphases and isinstance(emphases, list):
-                    gen_emphases_str = f"Place special emphasis on: {', '.join(emphases)}."
-
-                if gen_instructions.get("includeCharacterQuotes"):
-                    gen_quotes_str = "You MUST include direct quotes from characters."
-                if gen_instructions.get("includeGameMechanics"):
-                    gen_mechanics_str = "You MUST include references to game mechanics."
-
-            # Parse image instructions
-            image_instructions = metadata_content.get("image_instructions", {})
-            if image_instructions:
-                img_enabled = image_instructions.get("imageGenerationEnabled", True)
-                quality_key = image_instructions.get("imageQuality", "medium")
-                img_quality = image_quality_lookup.get(quality_key, "medium")
-                style_key = image_instructions.get("selectedStyle", "fantasy")
-                img_style_prompt = image_format_lookup.get(style_key, {}).get("longDescription", img_style_prompt)
-
-            # Parse new flags
-            generate_lore = metadata_content.get("generate_lore", False)
-            generate_name = metadata_content.get("generate_name", False)
+                    style_val = gen_instructions.get("contentStyle", 0.5)
+                    if style_val < 0.33:
+                        gen_content_style_str = "Write in a direct, factual, to-the-point style."
+                    elif style_val > 0.66:
+                        gen_content_style_str = "Write in a highly narrative, descriptive, and dramatic manner."
+
+                    tones = gen_instructions.get("selectedTones")
+                    if tones and isinstance(tones, list):
+                        gen_tones_str = f"Adopt the following tones: {', '.join(tones)}."
+
+                    emphases = gen_instructions.get("selectedEmphases")
+                    if emphases and isinstance(emphases, list):
+                        gen_emphases_str = f"Place special emphasis on: {', '.join(emphases)}."
+
+                    if gen_instructions.get("includeCharacterQuotes"):
+                        gen_quotes_str = "You MUST include direct quotes from characters."
+                    if gen_instructions.get("includeGameMechanics"):
+                        gen_mechanics_str = "You MUST include references to game mechanics."
+
+                # Parse image instructions
+                image_instructions = metadata_content.get("image_instructions", {})
+                if image_instructions:
+                    img_enabled = image_instructions.get("imageGenerationEnabled", True)
+                    quality_key = image_instructions.get("imageQuality", "medium")
+                    img_quality = image_quality_lookup.get(quality_key, "medium")
+                    style_key = image_instructions.get("selectedStyle", "fantasy")
+                    img_style_prompt = IMAGE_STYLE_DESCRIPTION.get(style_key, img_style_prompt)
+
+                # Parse new flags
+                generate_lore = metadata_content.get("generate_lore", False)
+                generate_name = metadata_content.get("generate_name", False)
             
-            metadata_instructions_str = metadata_content.get("instructions", "Not provided.")
+                metadata_instructions_str = metadata_content.get("instructions", "Not provided.")
 
-        except s3_client.exceptions.NoSuchKey:
-            print("Warning: Metadata file not found. Using defaults.")
-        except Exception as e:
-            print(f"Warning: Error fetching metadata: {e}")
+            except Exception as e:
+                print(f"Warning: Error parsing metadata: {e}")
 
         # --- Fetch Campaign Context ---
+        # Served from the context cache when the campaign is unchanged. Otherwise page
+        # one of every list comes back in a single aliased request, and any list that
+        # needs more pages (or whose alias failed) is then paged concurrently
         print("Fetching campaign context")
-        all_npcs, npc_context = fetch_campaign_data(campaign_id, GET_NPCS_BY_CAMPAIGN_QUERY, 'Npcs', 'nPC', debug)
-        all_adventurers, adventurer_context = fetch_campaign_data(campaign_id, GET_ADVENTURERS_BY_CAMPAIGN_QUERY, 'Adventurers', 'adventurer', debug)
-        all_locations, location_context = fetch_campaign_data(campaign_id, GET_LOCATIONS_BY_CAMPAIGN_QUERY, 'Locations', 'location', debug)
-        all_loot_items, loot_item_context = fetch_campaign_data(campaign_id, GET_LOOT_ITEMS_BY_CAMPAIGN_QUERY, 'LootItems', 'lootItem', debug)
+        if not campaign_id:
+            print("Session has no campaign; using empty campaign context")
+            campaign_context = {
+                data_key: (build_entity_index({}), f"No {item_key} context available from campaign.")
+                for data_key, _, item_key in CAMPAIGN_ENTITY_QUERIES
+            }
+        else:
+            campaign_context = get_cached_campaign_context(campaign_id, campaign_version)
+            if campaign_context:
+                print(f"Using cached campaign context (version {campaign_version})")
+            else:
+                context_response = execute_graphql_request(CAMPAIGN_CONTEXT_QUERY, {"campaignId": campaign_id, "limit": 50})
+                first_pages = context_response.get("data") or {}
+
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    context_futures = {
+                        data_key: executor.submit(fetch_campaign_data, campaign_id, query, data_key, item_key, debug, first_pages.get(data_key))
+                        for data_key, query, item_key in CAMPAIGN_ENTITY_QUERIES
+                    }
+                    fetched = {data_key: future.result() for data_key, future in context_futures.items()}
+                campaign_context = {data_key: (index, context) for data_key, (index, context, _) in fetched.items()}
+                # A failed or truncated fetch is used for this run only, never cached
+                if all(complete for _, _, complete in fetched.values()):
+                    put_cached_campaign_context(campaign_id, campaign_version, campaign_context)
+                else:
+                    print("Campaign context is incomplete; not caching it")
+
+        npc_index, npc_context = campaign_context['Npcs']
+        adventurer_index, adventurer_context = campaign_context['Adventurers']
+        location_index, location_context = campaign_context['Locations']
+        loot_item_index, loot_item_context = campaign_context['LootItems']
 
         # --- Read Transcript ---
-        print("Reading transcript from S3")
-        transcript_obj = s3_client.get_object(Bucket=s3_bucket, Key=key)
-        transcript_text = transcript_obj['Body'].read().decode('utf-8')
+        transcript_text = transcript_future.result()
         
         if not transcript_text.strip():
             raise ValueError(f"Transcript file {key} is empty.")
 
+        if len(transcript_text) > TRANSCRIPT_PREFILTER_THRESHOLD_CHARS:
+            original_length = len(transcript_text)
+            entity_names = npc_index["names"] + adventurer_index["names"] + location_index["names"] + loot_item_index["names"]
+            transcript_text = condense_transcript(transcript_text, entity_names)
+            print(f"Condensed transcript from {original_length} to {len(transcript_text)} characters")
+
         # --- Build LLM Prompt ---
         session_name_instruction = ""
         if generate_name:
@@ -503,10 +962,7 @@ def lambda_handler(event, context):
 Additionally, generate a compelling session title (3-7 words) that captures the essence of this session's events. 
 Return it in the "sessionName" field. If not generating a name, set sessionName to null."""
 
-        prompt = f"""You are Scribe, an AI assistant that summarizes TTRPG sessions.
-Generate a JSON object containing a TLDR, chronological session segments, and highlights for adventurers, locations, and NPCs.
-
-<generation_instructions>
+        prompt = f"""<generation_instructions>
 - Writing Style: {gen_content_style_str}
 - Content Length: {gen_content_length_str}
 - Tone: {gen_tones_str}
@@ -517,39 +973,6 @@ Generate a JSON object containing a TLDR, chronological session segments, and hi
 
 {session_name_instruction}
 
-<entity_classification_rules>
-IMPORTANT: Be strict about classifying entities correctly.
-
-ADVENTURERS are ONLY the Player Characters (PCs) - the characters controlled by players at the table. Signs of an adventurer:
-- Players speak in first person as this character ("I attack the goblin")
-- The DM/GM addresses a player by this character's name
-- Listed in the adventurer_context below
-- Only add NEW adventurers if you are highly confident a player is controlling them
-
-NPCs are ALL other characters, including:
-- Allies and companions who travel with the party (even if they fight alongside the party)
-- Quest givers, shopkeepers, innkeepers
-- Villains, enemies, monsters with names
-- Any character the DM/GM voices or controls
-- When in doubt, classify as NPC rather than adventurer
-</entity_classification_rules>
-
-Output a JSON object with:
-- `tldr`: A string summary of the whole session.
-- `sessionName`: A generated title (3-7 words) or null.
-- `sessionSegments`: A list of 3-5 chronological segments, each with 'title', 'description', 'image_prompt'.
-- `adventurerHighlights`, `locationHighlights`, `npcHighlights`, `lootItemHighlights`: Lists with 'name', 'highlights' (list of strings), 'id' (null), 'is_new' (boolean - true if entity is NOT in the campaign context below).
-
-For `lootItemHighlights`: include notable items that were found, received, used, or discussed during the session (weapons, armor, potions, treasures, magic items, etc.). Only include items that are meaningfully mentioned, not every minor consumable.
-
-Mark entities as is_new=true if they appear in the transcript but are NOT listed in the campaign context below.
-When matching names to existing entities, account for audio transcription errors causing phonetic misspellings (e.g., "Gorn" might actually be "Gron").
-
-Session Transcript:
-<session_text>
-{transcript_text}
-</session_text>
-
 User Instructions:
 <user_instructions>
 {metadata_instructions_str}
@@ -569,62 +992,97 @@ Campaign Context (existing entities):
 {loot_item_context}
 </loot_item_context>
 
-Example Output:
-{example_summary}
+Session Transcript:
+<session_text>
+{transcript_text}
+</session_text>
 """
-
-        # --- Call LLM ---
-        print("Generating summary with LLM")
-        try:
-            completion = openai_client.chat.completions.create(
-                model="gpt-5.2",
-                messages=[{"role": "user", "content": prompt}],
-                response_format={"type": "json_object"},
-                temperature=0.2,
-            )
-            
-            if not completion.choices or not completion.choices[0].message.content:
-                raise Exception("OpenAI response lacked content")
+        # The prompt now holds the only copy the rest of the handler needs
+        del transcript_text
+
+        # --- Call LLM (or reuse a cached response for an identical prompt) ---
+        cache_key = hashlib.sha256((NARRATIVE_SUMMARY_MODEL + NARRATIVE_SYSTEM_PROMPT + prompt).encode('utf-8')).hexdigest()
+        summary = None
+        cached_json = get_cached_summary_json(s3_bucket, cache_key)
+        if cached_json:
+            try:
+                summary = NARRATIVE_SUMMARY_ADAPTER.validate_json(cached_json)
+                print(f"Using cached summary: {cache_key}")
+            except Exception as e:
+                print(f"Warning: Ignoring invalid cached summary {cache_key}: {e}")
+
+        if summary is None:
+            print("Generating summary with LLM")
+            try:
+                completion = get_openai_client().chat.completions.create(
+                    model=NARRATIVE_SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": NARRATIVE_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    response_format=NARRATIVE_SUMMARY_RESPONSE_FORMAT,
+                    temperature=0.2,
+                )
                 
-            json_content = completion.choices[0].message.content
-            summary = NarrativeSummary.model_validate_json(json_content)
-            
-        except Exception as e:
-            print(f"Error calling OpenAI: {e}")
-            traceback.print_exc()
-            raise Exception(f"Failed to generate summary: {e}")
+                if not completion.choices or not completion.choices[0].message.content:
+                    raise Exception("OpenAI response lacked content")
+                    
+                json_content = completion.choices[0].message.content
+                summary = NARRATIVE_SUMMARY_ADAPTER.validate_json(json_content)
+                
+            except Exception as e:
+                print(f"Error calling OpenAI: {e}")
+                traceback.print_exc()
+                raise Exception(f"Failed to generate summary: {e}")
+
+            put_cached_summary_json(s3_bucket, cache_key, json_content)
 
         print("Summary generated successfully")
 
         # --- Map Entity IDs ---
         print("Mapping entity IDs")
-        map_ids_to_highlights(summary.adventurerHighlights, all_adventurers, 'adventurer', debug)
-        map_ids_to_highlights(summary.npcHighlights, all_npcs, 'nPC', debug)
-        map_ids_to_highlights(summary.locationHighlights, all_locations, 'location', debug)
-        map_ids_to_highlights(summary.lootItemHighlights, all_loot_items, 'lootItem', debug)
+        ambiguous_groups = []
+        for highlights, entity_index, entity_key in [
+            (summary.adventurerHighlights, adventurer_index, 'adventurer'),
+            (summary.npcHighlights, npc_index, 'nPC'),
+            (summary.locationHighlights, location_index, 'location'),
+            (summary.lootItemHighlights, loot_item_index, 'lootItem'),
+        ]:
+            unmatched = map_ids_to_highlights(highlights, entity_index, entity_key, debug)
+            if unmatched:
+                ambiguous_groups.append((unmatched, entity_index, entity_key))
+        match_highlights_by_embedding(ambiguous_groups, s3_bucket, campaign_id, debug)
 
         # --- Write Summary to S3 ---
+        # Upload in the background while the output is assembled; it is awaited before returning
         print("Writing narrative summary to S3")
         summary_s3_key = f"public/summaries/narrative/{filename_stem_for_metadata}.json"
-        s3_client.put_object(
+        write_executor = ThreadPoolExecutor(max_workers=1)
+        summary_write_future = write_executor.submit(
+            s3_client.put_object,
             Bucket=s3_bucket,
             Key=summary_s3_key,
-            Body=summary.model_dump_json(indent=2),
+            Body=summary.model_dump_json(),
             ContentType='application/json'
         )
-        print(f"Summary written to: {summary_s3_key}")
+        write_executor.shutdown(wait=False)
 
         # --- Build Output ---
-        # Separate existing vs new entities for downstream processing
-        existing_adventurers = [h.model_dump() for h in summary.adventurerHighlights if not h.is_new]
-        existing_npcs = [h.model_dump() for h in summary.npcHighlights if not h.is_new]
-        existing_locations = [h.model_dump() for h in summary.locationHighlights if not h.is_new]
-        existing_loot_items = [h.model_dump() for h in summary.lootItemHighlights if not h.is_new]
-
-        new_adventurers = [h.model_dump() for h in summary.adventurerHighlights if h.is_new]
-        new_npcs = [h.model_dump() for h in summary.npcHighlights if h.is_new]
-        new_locations = [h.model_dump() for h in summary.locationHighlights if h.is_new]
-        new_loot_items = [h.model_dump() for h in summary.lootItemHighlights if h.is_new]
+        # Separate existing vs new entities for downstream processing.
+        # One model_dump for all highlight lists, then a single partition pass per list.
+        highlight_dump = summary.model_dump(exclude={"tldr", "sessionSegments", "sessionName"})
+        entity_mentions = {}
+        for field_name, mention_suffix in [
+            ("adventurerHighlights", "Adventurers"),
+            ("npcHighlights", "NPCs"),
+            ("locationHighlights", "Locations"),
+            ("lootItemHighlights", "LootItems"),
+        ]:
+            existing, new = [], []
+            for highlight in highlight_dump[field_name]:
+                (new if highlight["is_new"] else existing).append(highlight)
+            entity_mentions[f"existing{mention_suffix}"] = existing
+            entity_mentions[f"new{mention_suffix}"] = new
 
         output = {
             "statusCode": 200,
@@ -648,22 +1106,16 @@ Example Output:
             "generateName": generate_name,
 
             # Entity data for downstream processing
-            "entityMentions": {
-                "existingAdventurers": existing_adventurers,
-                "existingNPCs": existing_npcs,
-                "existingLocations": existing_locations,
-                "existingLootItems": existing_loot_items,
-                "newAdventurers": new_adventurers,
-                "newNPCs": new_npcs,
-                "newLocations": new_locations,
-                "newLootItems": new_loot_items
-            },
+            "entityMentions": entity_mentions,
 
             # Passthrough fields
             "userTransactionsTransactionsId": event.get("userTransactionsTransactionsId"),
             "creditsToRefund": event.get("creditsToRefund")
         }
 
+        summary_write_future.result()
+        print(f"Summary written to: {summary_s3_key}")
+
         print("generate-narrative-summary completed successfully")
         return output
 
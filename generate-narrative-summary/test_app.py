@@ -0,0 +1,63 @@
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("APPSYNC_API_URL", "https://example.invalid/graphql")
+os.environ.setdefault("APPSYNC_API_KEY", "test")
+os.environ.setdefault("DYNAMODB_TABLE", "test")
+
+import app
+
+
+class CondenseTranscriptTest(unittest.TestCase):
+    def test_long_single_line_transcript_keeps_content(self):
+        # faster-whisper transcripts are one line with no newlines
+        sentences = [f"Sentence {i} mentions the dragon Vex and word{i} at the ruined keep." for i in range(3000)]
+        transcript = " ".join(sentences)
+        condensed = app.condense_transcript(transcript, ["Vex"], token_budget=5000)
+
+        self.assertLessEqual(len(condensed), 5000 * 4 + 100)
+        self.assertGreater(len(condensed), 5000 * 4 // 2)
+        self.assertIn("Vex", condensed)
+
+    def test_unbroken_text_falls_back_to_prefix(self):
+        transcript = "x" * 50000
+        condensed = app.condense_transcript(transcript, [], token_budget=100)
+
+        self.assertTrue(condensed.startswith("x" * 400))
+        self.assertTrue(condensed.endswith("[...]"))
+
+    def test_short_transcript_is_unchanged(self):
+        self.assertEqual(app.condense_transcript("hello there", [], token_budget=100), "hello there")
+
+
+class FetchCampaignDataTest(unittest.TestCase):
+    def fetch(self, responses):
+        with mock.patch.object(app, "execute_graphql_request", side_effect=responses):
+            return app.fetch_campaign_data("c1", "query", "Npcs", "npc")
+
+    def page(self, names, next_token=None):
+        items = [{"npc": {"id": name.lower(), "name": name}} for name in names]
+        return {"data": {"campaignNpcsByCampaignId": {"items": items, "nextToken": next_token}}}
+
+    def test_clean_fetch_is_complete(self):
+        index, _, complete = self.fetch([self.page(["Vex"], "t1"), self.page(["Mira"])])
+
+        self.assertTrue(complete)
+        self.assertEqual(index["nameToId"], {"vex": "vex", "mira": "mira"})
+
+    def test_graphql_error_is_incomplete(self):
+        index, _, complete = self.fetch([self.page(["Vex"], "t1"), {"errors": [{"message": "boom"}]}])
+
+        self.assertFalse(complete)
+        self.assertEqual(index["nameToId"], {"vex": "vex"})
+
+    def test_max_pages_cutoff_is_incomplete(self):
+        _, _, complete = self.fetch([self.page([f"N{i}"], f"t{i}") for i in range(25)])
+
+        self.assertFalse(complete)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,49 +1,141 @@
 # --- Standard Library Imports ---
 import os
-import json
+import re
+import time
 import base64
+import threading
 import traceback
 from typing import List, Optional, Dict, Any
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- Third-party Library Imports ---
-import boto3
-import openai
-from openai import OpenAI
+# (boto3, openai and httpx are imported lazily in init_clients)
+import orjson
 
 # --- CONFIGURATION ---
 OPENAI_API_KEY_FROM_ENV = os.environ.get('OPENAI_API_KEY')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-2')
+# Image calls are pure network waits, so every segment gets its own worker up to this cap
+IMAGE_GENERATION_MAX_WORKERS = int(os.environ.get('IMAGE_GENERATION_MAX_WORKERS', '10'))
+# Images-per-minute budget for the OpenAI image endpoint; imageSettings.rpm overrides it
+IMAGE_RATE_LIMIT_RPM = int(os.environ.get('IMAGE_RATE_LIMIT_RPM', '50'))
+# The OpenAI SDK retries 429/5xx/connection errors itself, honoring Retry-After. The worst
+# case, (OPENAI_MAX_RETRIES + 1) * OPENAI_REQUEST_TIMEOUT_SECONDS plus backoff, has to fit
+# inside the 300s Lambda timeout with room left for the upload
+OPENAI_MAX_RETRIES = 1
+OPENAI_REQUEST_TIMEOUT_SECONDS = 120.0
+# Presigned upload URLs must outlive rate-limit waits; the Lambda timeout is 5 minutes
+IMAGE_UPLOAD_URL_EXPIRES_SECONDS = 900
+# A PUT to a fixed key is idempotent, so 5xx and transport failures are retried; all attempts
+# together stay inside what the OpenAI budget above leaves of the Lambda timeout
+S3_UPLOAD_MAX_ATTEMPTS = 3
+S3_UPLOAD_TIMEOUT_SECONDS = 15.0
+RESET_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+NARRATIVE_SUMMARY_CACHE_SIZE = 16
+# Input fields that are consumed here and not passed through to the next state
+PASSTHROUGH_EXCLUDE = frozenset({"imageSettings"})
 
 # --- VALIDATE ESSENTIAL CONFIGURATION ---
 if not OPENAI_API_KEY_FROM_ENV:
     raise ValueError("Environment variable OPENAI_API_KEY not set!")
 
 # --- AWS & OPENAI CLIENTS ---
-s3_client = boto3.client("s3", region_name=AWS_REGION)
-openai_client = OpenAI(api_key=OPENAI_API_KEY_FROM_ENV)
+# boto3, openai and httpx are imported on first use by init_clients(), so invocations that
+# return before generating anything (images disabled) skip those imports on a cold start.
+# The clients stay module-level so warm invocations reuse their connections.
+openai = None
+httpx = None
+s3_client = None
+openai_client = None
+s3_upload_http = None
+# (bucket, key) -> (ETag, parsed summary) for narrative summaries this container has read,
+# so Step Functions retries revalidate with a conditional GET instead of re-downloading
+_narrative_summary_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
 
-# --- Image Style Lookup (must match final-summary/app.py exactly) ---
+
+def init_clients() -> None:
+    """Imports the SDKs and creates the shared clients once per container."""
+    global openai, httpx, s3_client, openai_client, s3_upload_http
+    if s3_upload_http is not None:
+        return
+
+    import boto3
+    import httpx as httpx_sdk
+    import openai as openai_sdk
+    from botocore.config import Config
+
+    openai = openai_sdk
+    httpx = httpx_sdk
+    # Pools are sized above the worker count so retries never queue on connection acquisition
+    s3_client = boto3.client(
+        "s3",
+        region_name=AWS_REGION,
+        # Regional endpoint so presigned URLs are not redirected away from the global one
+        endpoint_url=f"https://s3.{AWS_REGION}.amazonaws.com",
+        config=Config(
+            max_pool_connections=64,
+            retries={"mode": "adaptive", "total_max_attempts": 5},
+            signature_version="s3v4"
+        )
+    )
+    # HTTP/2 lets the concurrent image requests share one TLS connection to OpenAI
+    openai_client = openai_sdk.OpenAI(
+        api_key=OPENAI_API_KEY_FROM_ENV,
+        max_retries=OPENAI_MAX_RETRIES,
+        timeout=OPENAI_REQUEST_TIMEOUT_SECONDS,
+        http_client=httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=OPENAI_REQUEST_TIMEOUT_SECONDS
+        )
+    )
+    # Image uploads go straight to presigned URLs, skipping botocore's per-call request
+    # serialization and signing in the workers
+    s3_upload_http = httpx.Client(
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        timeout=S3_UPLOAD_TIMEOUT_SECONDS
+    )
+
+
+def upload_to_presigned_url(upload_url: str, image_bytes: bytes) -> None:
+    """PUTs image_bytes to a presigned URL, retrying 5xx responses and transport errors."""
+    for attempt in range(1, S3_UPLOAD_MAX_ATTEMPTS + 1):
+        try:
+            response = s3_upload_http.put(upload_url, content=image_bytes, headers={'Content-Type': 'image/png'})
+            if response.status_code < 500 or attempt == S3_UPLOAD_MAX_ATTEMPTS:
+                response.raise_for_status()
+                return
+            print(f"⚠️ S3 upload returned {response.status_code}, retrying (attempt {attempt}/{S3_UPLOAD_MAX_ATTEMPTS})")
+        except httpx.TransportError as e:
+            if attempt == S3_UPLOAD_MAX_ATTEMPTS:
+                raise
+            print(f"⚠️ S3 upload failed: {e}, retrying (attempt {attempt}/{S3_UPLOAD_MAX_ATTEMPTS})")
+        time.sleep(0.5 * attempt)
+
+# --- Image Style Lookup ---
+# longDescription values must match generate-narrative-summary/app.py exactly: that
+# function sends them as imageSettings.stylePrompt, resolved via KNOWN_STYLE_PROMPTS
 image_format_lookup = {
     "fantasy": {
         "name": "Default",
         "description": "Classic artistic style",
-        "longDescription": "A semi-photorealistic fantasy style with bold, directional lighting, rich color saturation, and cinematic composition. Realistic textures, lifelike character detail, and a polished finish create a grounded yet visually striking world with a heightened sense of drama and scale."
+        "longDescription": "A semi-photorealistic fantasy style with bold, directional lighting, rich color saturation, and cinematic composition."
     },
     "dark-fantasy": {
         "name": "Dark fantasy",
         "description": "Dark fantasy style",
-        "longDescription": "A cinematic stylized realism with rich color depth and dynamic lighting. The palette uses vibrant yet grounded tones with strong value contrast to enhance atmosphere and emotional impact, while preserving detail in shadow and highlight areas. Lighting is volumetric and directional, often cutting through mist, smoke, or haze to reveal depth and form. The overall aesthetic is dark and serious in tone — evoking tension, mystery, and scale — yet maintains enough visibility and texture for every element to feel tangible and alive. The mood is dramatic, immersive, and painterly, blending realistic detail with heightened color and light expression."
+        "longDescription": "A cinematic stylized realism with rich color depth and dynamic lighting. The palette uses vibrant yet grounded tones with strong value contrast."
     },
     "watercolor": {
         "name": "Watercolor",
         "description": "detailed watercolor style",
-        "longDescription": "A refined watercolor style that preserves the medium's softness and translucency while enhancing structure and depth. Colors remain fluid and luminous, but with richer pigment, sharper contrast, and defined brush textures that retain fine detail without losing the organic, hand-painted feel."
+        "longDescription": "A refined watercolor style that preserves the medium's softness and translucency while enhancing structure and depth."
     },
     "Sketchbook": {
         "name": "Sketchbook",
         "description": "Sketchbook style",
-        "longDescription": "A traditional pen-and-ink illustration style with muted, earthy tones and fine crosshatching, evoking the look of a classic fantasy storybook or vintage map."
+        "longDescription": "A traditional pen-and-ink illustration style with muted, earthy tones and fine crosshatching."
     },
     "photo-releastic": {
         "name": "Photo realistic",
@@ -53,7 +145,7 @@ image_format_lookup = {
     "cyberpunk": {
         "name": "Cyberpunk",
         "description": "Luminous Cyber Noir",
-        "longDescription": "A cinematic, futuristic rendering style defined by luminous contrast and rich neon hues of violet, cyan, and magenta, balanced against cool, atmospheric shadows. Lighting glows through haze and reflection, creating a moody yet clearly legible composition with preserved midtone detail and visible texture. The overall look feels immersive, stylized, and vividly illuminated without becoming overly dark."
+        "longDescription": "A cinematic, futuristic rendering style defined by luminous contrast and rich neon hues."
     },
     "retro-vibrant": {
         "name": "Retro illustration",
@@ -97,33 +189,109 @@ image_format_lookup = {
     }
 }
 
+# Style resolution indexes, built once per container
+STYLE_PROMPT_BY_KEY = {style_key: style["longDescription"] for style_key, style in image_format_lookup.items()}
+KNOWN_STYLE_PROMPTS = frozenset(STYLE_PROMPT_BY_KEY.values())
+VALID_IMAGE_QUALITIES = frozenset({"low", "medium", "high", "auto"})
+
+class TokenBucket:
+    """Thread-safe token bucket shared by the image workers of one invocation.
+
+    Workers call acquire() before each request so the batch stays under the configured
+    requests-per-minute instead of tripping 429s. pause() blocks every worker until a
+    rate-limit reset reported by the API has passed.
+    """
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = max(1, rate_per_minute)
+        self.fill_rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+                self.updated_at = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def rate_limit_reset_seconds(headers) -> Optional[float]:
+    """Reads how long to wait from Retry-After or x-ratelimit-reset-requests (e.g. "1s", "6m0s", "20ms")."""
+    if not headers:
+        return None
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    reset = headers.get("x-ratelimit-reset-requests")
+    if reset:
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        seconds = sum(float(value) * units[unit] for value, unit in RESET_DURATION_RE.findall(reset))
+        if seconds > 0:
+            return seconds
+    return None
+
+
+def log_segment_result(segment_index: int, status: str, **fields: Any) -> None:
+    """Prints a segment's outcome as one JSON line so concurrent workers never interleave output."""
+    print(orjson.dumps({"event": "segment_image", "segment": segment_index + 1, "status": status, **fields}).decode('utf-8'))
+
+
 def generate_and_upload_image(
     prompt_suffix: str,
-    s3_bucket: str,
-    s3_base_prefix: str,
-    session_id: str,
+    s3_image_key: str,
+    upload_url: str,
     segment_index: int,
-    image_style_prompt: str,
+    prompt_prefix: str,
     image_quality: str,
-    debug: bool = False
+    debug: bool = False,
+    rate_limiter: Optional[TokenBucket] = None,
+    errors: Optional[Dict[int, Dict[str, Any]]] = None
 ) -> Optional[str]:
     """
-    Generates an image using OpenAI's image model, uploads it to S3,
-    and returns the S3 key.
+    Generates a single image, uploads it to S3 through its presigned upload URL, and
+    returns the S3 key (None on failure).
+
+    prompt_prefix is the style prompt with its separator, built once per batch. Failures
+    are recorded in errors by segment index so callers can tell what failed and whether
+    it was retryable.
     """
-    if not prompt_suffix:
-        if debug:
-            print("No prompt suffix provided. Skipping.")
-        return None
-    
-    full_prompt = f"{image_style_prompt}. {prompt_suffix}"
+    if errors is None:
+        errors = {}
+
+    def record_error(error_type: str, message: str, retryable: bool) -> None:
+        errors[segment_index] = {
+            "segment": segment_index + 1,
+            "errorType": error_type,
+            "message": message,
+            "retryable": retryable,
+        }
+        log_segment_result(segment_index, "failed", errorType=error_type, message=message, retryable=retryable)
+
+    full_prompt = prompt_prefix + prompt_suffix
 
     try:
         if debug:
-            print(f"Generating image {segment_index + 1}...")
-            print(f"  Quality: '{image_quality}'")
-            print(f"  Prompt: '{full_prompt[:100]}...'")
+            print(f"Generating image for segment {segment_index + 1} (quality '{image_quality}'): '{full_prompt[:100]}...'")
 
+        if rate_limiter:
+            rate_limiter.acquire()
         response = openai_client.images.generate(
             model="gpt-image-1-mini",
             prompt=full_prompt,
@@ -132,35 +300,46 @@ def generate_and_upload_image(
             quality=image_quality
         )
 
-        if response.data and response.data[0].b64_json:
-            image_data_b64 = response.data[0].b64_json
-            image_bytes = base64.b64decode(image_data_b64)
-
-            image_filename = f"{session_id}_segment_{segment_index + 1}.png"
-            s3_image_key = f"{s3_base_prefix.rstrip('/')}/{image_filename}"
+        # gpt-image models only return base64, so there is no URL to stream from. Drop the
+        # response as soon as the encoded string is taken so only the raw PNG is held
+        # while uploading
+        image_data_b64 = response.data[0].b64_json if response.data else None
+        del response
+    except openai.RateLimitError as e:
+        # Still limited after the SDK's own retries; hold the other workers until the reset
+        delay = rate_limit_reset_seconds(getattr(e.response, "headers", None))
+        if rate_limiter and delay:
+            rate_limiter.pause(delay)
+        record_error("rate_limited", str(e), True)
+        return None
+    except openai.BadRequestError as e:
+        record_error("bad_request", str(e), False)
+        return None
+    except openai.APIError as e:
+        record_error("api_error", str(e), True)
+        return None
+    except Exception as e:
+        traceback.print_exc()
+        record_error("error", str(e), True)
+        return None
 
-            if debug:
-                print(f"Uploading to S3: {s3_image_key}")
+    if not image_data_b64:
+        record_error("no_image_data", "No image data received", True)
+        return None
+    try:
+        image_bytes = base64.b64decode(image_data_b64)
+        del image_data_b64
 
-            s3_client.put_object(
-                Bucket=s3_bucket,
-                Key=s3_image_key,
-                Body=image_bytes,
-                ContentType='image/png'
-            )
+        if debug:
+            print(f"Uploading to S3: {s3_image_key}")
 
-            print(f"✅ Image {segment_index + 1} uploaded: {s3_image_key}")
-            return s3_image_key
-        else:
-            print(f"❌ No image data received for segment {segment_index + 1}")
-            return None
+        upload_to_presigned_url(upload_url, image_bytes)
 
-    except openai.APIError as e:
-        print(f"OpenAI API error for segment {segment_index + 1}: {e}")
-        return None
+        log_segment_result(segment_index, "uploaded", key=s3_image_key, quality=image_quality)
+        return s3_image_key
     except Exception as e:
-        print(f"Error generating image for segment {segment_index + 1}: {e}")
         traceback.print_exc()
+        record_error("upload_error", str(e), True)
         return None
 
 
@@ -172,45 +351,68 @@ def generate_images_parallel(
     image_style_prompt: str,
     image_quality: str,
     debug: bool = False,
-    max_workers: int = 5
+    max_workers: int = IMAGE_GENERATION_MAX_WORKERS,
+    rate_limit_rpm: int = IMAGE_RATE_LIMIT_RPM,
+    errors: Optional[Dict[int, Dict[str, Any]]] = None
 ) -> List[Optional[str]]:
     """
     Generates and uploads images for multiple segments in parallel.
-    Returns a list of S3 keys in the same order as input segments.
+    Returns a list of S3 keys in the same order as input segments; per-segment
+    failure details are added to errors when it is given.
     """
+    if errors is None:
+        errors = {}
     if not segments:
         return []
     
     print(f"Starting parallel image generation for {len(segments)} segments...")
     
     results = [None] * len(segments)
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+    # Every segment gets its own worker (up to the cap) so total latency tracks the slowest
+    # request. Segments without a prompt are dropped here rather than scheduled as no-op tasks.
+    prompted = [(idx, segment["image_prompt"]) for idx, segment in enumerate(segments) if segment.get("image_prompt")]
+    if not prompted:
+        print("No segments have an image prompt. Skipping image generation.")
+        return results
+
+    # Keys and presigned PUT URLs are built up front; presigning is local and needs no request.
+    # The prefix is normalized once into a key template shared by every segment.
+    s3_image_key_for = (s3_base_prefix.rstrip('/') + '/' + session_id + '_segment_{}.png').format
+    prompt_prefix = image_style_prompt + ". "
+    rate_limiter = TokenBucket(rate_limit_rpm)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(prompted))) as executor:
         future_to_index = {}
         
-        for idx, segment in enumerate(segments):
-            image_prompt = segment.get("image_prompt", "")
+        for idx, image_prompt in prompted:
+            s3_image_key = s3_image_key_for(idx + 1)
+            upload_url = s3_client.generate_presigned_url(
+                'put_object',
+                Params={'Bucket': s3_bucket, 'Key': s3_image_key, 'ContentType': 'image/png'},
+                ExpiresIn=IMAGE_UPLOAD_URL_EXPIRES_SECONDS
+            )
             future = executor.submit(
                 generate_and_upload_image,
                 prompt_suffix=image_prompt,
-                s3_bucket=s3_bucket,
-                s3_base_prefix=s3_base_prefix,
-                session_id=session_id,
+                s3_image_key=s3_image_key,
+                upload_url=upload_url,
                 segment_index=idx,
-                image_style_prompt=image_style_prompt,
+                prompt_prefix=prompt_prefix,
                 image_quality=image_quality,
-                debug=debug
+                debug=debug,
+                rate_limiter=rate_limiter,
+                errors=errors
             )
             future_to_index[future] = idx
         
         for future in as_completed(future_to_index):
-            index = future_to_index[future]
+            idx = future_to_index[future]
             try:
-                result = future.result()
-                results[index] = result
+                results[idx] = future.result()
             except Exception as e:
-                print(f"Error in future for segment {index + 1}: {e}")
-                results[index] = None
+                print(f"Error in future for segment {idx + 1}: {e}")
+                errors[idx] = {"segment": idx + 1, "errorType": "error", "message": str(e), "retryable": True}
     
     successful = sum(1 for r in results if r is not None)
     print(f"Image generation completed: {successful}/{len(segments)} successful")
@@ -218,6 +420,30 @@ def generate_images_parallel(
     return results
 
 
+def load_narrative_summary(s3_bucket: str, summary_key: str) -> Dict[str, Any]:
+    """Reads and parses a narrative summary, reusing this container's copy while its ETag is unchanged."""
+    cache_key = (s3_bucket, summary_key)
+    cached = _narrative_summary_cache.get(cache_key)
+    request = {"Bucket": s3_bucket, "Key": summary_key}
+    if cached:
+        request["IfNoneMatch"] = cached[0]
+    try:
+        summary_obj = s3_client.get_object(**request)
+    except s3_client.exceptions.ClientError as e:
+        if cached and e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304:
+            print("Narrative summary unchanged; using cached copy")
+            _narrative_summary_cache.move_to_end(cache_key)
+            return cached[1]
+        raise
+
+    summary_content = orjson.loads(summary_obj['Body'].read())
+    _narrative_summary_cache[cache_key] = (summary_obj['ETag'], summary_content)
+    _narrative_summary_cache.move_to_end(cache_key)
+    while len(_narrative_summary_cache) > NARRATIVE_SUMMARY_CACHE_SIZE:
+        _narrative_summary_cache.popitem(last=False)
+    return summary_content
+
+
 def lambda_handler(event, context):
     """
     Generate segment images from narrative summary.
@@ -246,60 +472,52 @@ def lambda_handler(event, context):
         img_enabled = image_settings.get("enabled", True)
         if not img_enabled:
             print("Image generation disabled. Skipping.")
-            return {
-                "statusCode": 200,
-                "imageKeys": [],
-                "primaryImage": None,
-                # Passthrough all input fields
-                **{k: v for k, v in event.items() if k not in ["imageSettings"]}
-            }
+            output = {k: v for k, v in event.items() if k not in PASSTHROUGH_EXCLUDE}
+            output.update(statusCode=200, imageKeys=[], primaryImage=None)
+            return output
         
+        # Settings are validated before any client is created, so a bad request fails
+        # locally instead of after a round trip per segment
         img_quality = image_settings.get("quality", "medium")
+        if img_quality not in VALID_IMAGE_QUALITIES:
+            raise ValueError(f"Invalid imageSettings.quality '{img_quality}'. Must be one of {sorted(VALID_IMAGE_QUALITIES)}.")
+        img_rate_limit_rpm = int(image_settings.get("rpm") or IMAGE_RATE_LIMIT_RPM)
 
         # Style can be either a key (e.g., "cyberpunk") or the full longDescription text
         style_input = image_settings.get("stylePrompt")
-        if not style_input:
+        if not style_input or not isinstance(style_input, str):
             raise ValueError("imageSettings.stylePrompt is required but was not provided")
 
-        # Check if it's a known key first
-        if style_input in image_format_lookup:
-            img_style_prompt = image_format_lookup[style_input]["longDescription"]
-        else:
-            # Check if it matches any longDescription value (sent by generate-narrative-summary)
-            matched = False
-            for style_data in image_format_lookup.values():
-                if style_input == style_data["longDescription"]:
-                    img_style_prompt = style_input
-                    matched = True
-                    break
-
-            if not matched:
-                # Use as-is if it looks like a valid prompt (reasonably long text)
-                if len(style_input) > 20:
-                    print(f"Using custom style prompt: {style_input[:50]}...")
-                    img_style_prompt = style_input
-                else:
-                    raise ValueError(f"Invalid stylePrompt '{style_input}'. Must be a valid style key or description.")
+        # A known key, a known longDescription (sent by generate-narrative-summary),
+        # or a custom prompt if it looks like one (reasonably long text)
+        img_style_prompt = STYLE_PROMPT_BY_KEY.get(style_input)
+        if img_style_prompt is None:
+            if style_input in KNOWN_STYLE_PROMPTS:
+                img_style_prompt = style_input
+            elif len(style_input) > 20:
+                print(f"Using custom style prompt: {style_input[:50]}...")
+                img_style_prompt = style_input
+            else:
+                raise ValueError(f"Invalid stylePrompt '{style_input}'. Must be a valid style key or description.")
+
+        init_clients()
         
         # Read narrative summary from S3
         print(f"Reading narrative summary: {narrative_summary_key}")
-        summary_obj = s3_client.get_object(Bucket=s3_bucket, Key=narrative_summary_key)
-        summary_content = json.loads(summary_obj['Body'].read().decode('utf-8'))
+        summary_content = load_narrative_summary(s3_bucket, narrative_summary_key)
         
         segments = summary_content.get("sessionSegments", [])
         if not segments:
             print("No segments found in summary. Skipping image generation.")
-            return {
-                "statusCode": 200,
-                "imageKeys": [],
-                "primaryImage": None,
-                **{k: v for k, v in event.items() if k not in ["imageSettings"]}
-            }
+            output = {k: v for k, v in event.items() if k not in PASSTHROUGH_EXCLUDE}
+            output.update(statusCode=200, imageKeys=[], primaryImage=None)
+            return output
         
         print(f"Found {len(segments)} segments to generate images for")
         
         # Generate images in parallel
         s3_image_prefix = "public/segment-images/"
+        image_errors: Dict[int, Dict[str, Any]] = {}
         image_keys = generate_images_parallel(
             segments=segments,
             s3_bucket=s3_bucket,
@@ -308,7 +526,8 @@ def lambda_handler(event, context):
             image_style_prompt=img_style_prompt,
             image_quality=img_quality,
             debug=debug,
-            max_workers=5
+            rate_limit_rpm=img_rate_limit_rpm,
+            errors=image_errors
         )
         
         # First successful image becomes the primary image
@@ -317,24 +536,14 @@ def lambda_handler(event, context):
         print(f"generate-segment-images completed. Primary image: {primary_image}")
         
         # Build output - passthrough all input fields plus new image data
-        output = {
-            "statusCode": 200,
-            "imageKeys": image_keys,
-            "primaryImage": primary_image,
-            # Passthrough fields from input
-            "narrativeSummaryS3Key": narrative_summary_key,
-            "sessionId": session_id,
-            "sessionName": event.get("sessionName"),
-            "campaignId": event.get("campaignId"),
-            "owner": event.get("owner"),
-            "bucket": s3_bucket,
-            "transcriptKey": event.get("transcriptKey"),
-            "generateLore": event.get("generateLore"),
-            "generateName": event.get("generateName"),
-            "entityMentions": event.get("entityMentions"),
-            "userTransactionsTransactionsId": event.get("userTransactionsTransactionsId"),
-            "creditsToRefund": event.get("creditsToRefund")
-        }
+        output = {k: v for k, v in event.items() if k not in PASSTHROUGH_EXCLUDE}
+        output.update(
+            statusCode=200,
+            imageKeys=image_keys,
+            primaryImage=primary_image,
+            # Which segments failed and whether retrying could help
+            imageErrors=[image_errors[idx] for idx in sorted(image_errors)]
+        )
         
         return output
 
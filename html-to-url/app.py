@@ -1,40 +1,77 @@
-import json
+import orjson
 import boto3
 import os
 import uuid
 import base64
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 import re
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 
-s3 = boto3.client('s3')
+IMAGE_FETCH_MAX_WORKERS = 16
+
+s3 = boto3.client('s3', config=Config(max_pool_connections=IMAGE_FETCH_MAX_WORKERS))
 bucket_name = os.environ.get('S3_BUCKET_NAME')
 
+# Full documents are re-serialized with their doctype; anything else is treated as a fragment
+DOCUMENT_RE = re.compile(r'<!doctype|<html[\s>]', re.IGNORECASE)
+
+def fetch_s3_image_data_uri(src):
+    """Downloads an s3://bucket/key image and returns it as a data URI, or None on failure."""
+    try:
+        s3_uri_parts = src[5:].split('/', 1)
+        image_bucket = s3_uri_parts[0]
+        image_key = s3_uri_parts[1]
+
+        response = s3.get_object(Bucket=image_bucket, Key=image_key)
+        image_data = response['Body'].read()
+
+        content_type = response.get('ContentType', 'image/jpeg')
+
+        # base64 output is pure ASCII, so the cheap ascii decode is enough
+        return 'data:%s;base64,%s' % (content_type, base64.b64encode(image_data).decode('ascii'))
+    except Exception as e:
+        print(f"Error processing S3 image {src}: {e}")
+        return None
+
 def embed_s3_images(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    for img in soup.find_all('img'):
-        src = img.get('src')
-        if src and src.startswith('s3://'):
-            try:
-                s3_uri_parts = src.replace('s3://', '').split('/', 1)
-                image_bucket = s3_uri_parts[0]
-                image_key = s3_uri_parts[1]
-                
-                response = s3.get_object(Bucket=image_bucket, Key=image_key)
-                image_data = response['Body'].read()
-                
-                content_type = response.get('ContentType', 'image/jpeg')
-                
-                base64_data = base64.b64encode(image_data).decode('utf-8')
-                
-                img['src'] = f"data:{content_type};base64,{base64_data}"
-            except Exception as e:
-                print(f"Error processing S3 image {src}: {e}")
-
-    return str(soup)
+    if not html_content.strip():
+        return html_content
+
+    is_document = bool(DOCUMENT_RE.search(html_content))
+    leading_text = ''
+    if is_document:
+        roots = [lxml_html.document_fromstring(html_content)]
+    else:
+        roots = lxml_html.fragments_fromstring(html_content)
+        if roots and isinstance(roots[0], str):
+            leading_text = roots.pop(0)
+
+    # Collect every S3 image first, fetch them concurrently, then splice the data URIs in
+    s3_images = [
+        (img, img.get('src'))
+        for root in roots
+        for img in root.iter('img')
+        if (img.get('src') or '').startswith('s3://')
+    ]
+    if s3_images:
+        # Repeated images (logos, banners) are downloaded and encoded once per unique URI
+        unique_srcs = list(dict.fromkeys(src for _, src in s3_images))
+        with ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_MAX_WORKERS, len(unique_srcs))) as executor:
+            data_uri_by_src = dict(zip(unique_srcs, executor.map(fetch_s3_image_data_uri, unique_srcs)))
+        for img, src in s3_images:
+            data_uri = data_uri_by_src[src]
+            if data_uri:
+                img.set('src', data_uri)
+
+    if is_document:
+        tree = roots[0].getroottree()
+        return lxml_html.tostring(tree, encoding='unicode', doctype=tree.docinfo.doctype)
+    return leading_text + ''.join(lxml_html.tostring(root, encoding='unicode') for root in roots)
 
 def handler(event, context):
     try:
-        body = json.loads(event['body'])
+        body = orjson.loads(event['body'])
         html_content = body['html']
         file_id = body['id']
         
@@ -54,10 +91,10 @@ def handler(event, context):
         
         return {
             'statusCode': 200,
-            'body': json.dumps({'public_url': public_url})
+            'body': orjson.dumps({'public_url': public_url}).decode('utf-8')
         }
     except Exception as e:
         return {
             'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
+            'body': orjson.dumps({'error': str(e)}).decode('utf-8')
         }
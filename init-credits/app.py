@@ -1,118 +1,189 @@
 # --- Standard Library Imports ---
-import json
 import os
+import socket
+import time
+import traceback
+from functools import lru_cache, wraps
 from typing import Optional, Dict, Any
 
 # --- Third-party Library Imports ---
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 
 # --- Global Variables ---
 APPSYNC_API_URL = os.environ.get('APPSYNC_API_URL')
 APPSYNC_API_KEY = os.environ.get('APPSYNC_API_KEY')
+DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'  # Log full AppSync payloads and responses
+# Error type AppSync returns when a create hits an existing id (the generated
+# create resolver guards with attribute_not_exists(id))
+DUPLICATE_RECORD_ERROR_TYPE = 'DynamoDB:ConditionalCheckFailedException'
+SETTING_CACHE_TTL_SECONDS = float(os.environ.get('SETTING_CACHE_TTL', '300'))  # 0 disables the cache
+
+# --- VALIDATE ESSENTIAL CONFIGURATION ---
+if not APPSYNC_API_URL or not APPSYNC_API_KEY:
+    raise ValueError("APPSYNC_API_URL and APPSYNC_API_KEY environment variables must be set.")
+
+# TCP keepalive probes so sockets idle across a container freeze are detected
+# as dead instead of failing the next request with a reset
+KEEPALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+] + [
+    (socket.IPPROTO_TCP, getattr(socket, name), value)
+    for name, value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 30))
+    if hasattr(socket, name)
+]
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections enable TCP keepalive."""
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = KEEPALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+# Reused across warm invocations so AppSync calls skip the TCP/TLS handshake.
+# Retrying POSTs is safe here: the only mutation is a conditional create.
+appsync_session = requests.Session()
+appsync_session.mount('https://', KeepAliveHTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=10,
+    max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504], allowed_methods=["POST"])
+))
+appsync_session.headers.update({
+    'Content-Type': 'application/json',
+    'x-api-key': APPSYNC_API_KEY
+})
+
+# --- GraphQL Queries and Mutations ---
+GET_SYSTEM_SETTING_QUERY = """
+query GetSystemSettingByKey($settingKey: String!, $filter: ModelSystemSettingsFilterInput) {
+  getSystemSettingByKey(settingKey: $settingKey, filter: $filter) {
+    items {
+      id
+      settingKey
+      settingValue
+      isActive
+      _version
+    }
+  }
+}
+"""
+
+CREATE_USER_TRANSACTIONS_MUTATION = """
+mutation CreateUserTransactions($input: CreateUserTransactionsInput!) {
+  createUserTransactions(input: $input) {
+    id
+    email
+    creditBalance
+    owner
+    _version
+  }
+}
+"""
 
 # --- AppSync Helper Function ---
 def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Executes a GraphQL query/mutation against the AppSync endpoint.
     """
-    if not APPSYNC_API_URL or not APPSYNC_API_KEY:
-        raise ValueError("APPSYNC_API_URL and APPSYNC_API_KEY environment variables must be set.")
-
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': APPSYNC_API_KEY
-    }
     payload = {"query": query, "variables": variables or {}}
 
     try:
-        print(f"Executing AppSync request with payload: {json.dumps(payload)}")
-        response = requests.post(APPSYNC_API_URL, headers=headers, json=payload, timeout=30)
+        body = orjson.dumps(payload)
+        if DEBUG:
+            print(f"Executing AppSync request with payload: {body.decode('utf-8')}")
+        response = appsync_session.post(APPSYNC_API_URL, data=body, timeout=30)
         response.raise_for_status()
-        response_json = response.json()
-        print(f"Received AppSync response: {json.dumps(response_json)}")
+        if DEBUG:
+            print(f"Received AppSync response: {response.text}")
+        response_json = orjson.loads(response.content)
         if "errors" in response_json and response_json["errors"]:
             print(f"[ERROR] GraphQL errors: {response_json['errors']}")
         return response_json
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         print(f"[ERROR] Error making AppSync request: {e}")
         return {"errors": [{"message": str(e)}]}
 
+# --- Warm-Container Cache ---
+class _NotCached(Exception):
+    """Raised inside ttl_cache to keep a None result out of the cache."""
+
+def ttl_cache(seconds: float, maxsize: int = 32):
+    """
+    Caches a function's non-None results per argument tuple for roughly `seconds`.
+    Entries are keyed on a monotonic time bucket, so each TTL window starts a
+    fresh lru_cache key and stale entries age out through LRU eviction.
+    """
+    def decorator(func):
+        @lru_cache(maxsize=maxsize)
+        def cached(ttl_bucket, *args):
+            result = func(*args)
+            if result is None:
+                raise _NotCached()
+            return result
+
+        @wraps(func)
+        def wrapper(*args):
+            if seconds <= 0:
+                return func(*args)
+            try:
+                return cached(int(time.monotonic() // seconds), *args)
+            except _NotCached:
+                return None
+
+        return wrapper
+    return decorator
+
 # --- AppSync Data Access Helpers ---
 
+# System settings change rarely; a warm container reuses each value for up to
+# SETTING_CACHE_TTL_SECONDS before fetching it again
+@ttl_cache(SETTING_CACHE_TTL_SECONDS)
 def get_system_setting(setting_key: str):
-    """Fetches a system setting by its key."""
-    query = """
-    query GetSystemSettingByKey($settingKey: String!, $filter: ModelSystemSettingsFilterInput) {
-      getSystemSettingByKey(settingKey: $settingKey, filter: $filter) {
-        items {
-          id
-          settingKey
-          settingValue
-          isActive
-          _version
-        }
-      }
-    }
-    """
+    """Fetches a system setting by its key, served from the warm-container cache when fresh."""
     variables = {"settingKey": setting_key, "filter": {"isActive": {"eq": True}}}
-    response = execute_graphql_request(query, variables)
-    items = response.get("data", {}).get("getSystemSettingByKey", {}).get("items", [])
+    response = execute_graphql_request(GET_SYSTEM_SETTING_QUERY, variables)
+    try:
+        items = response["data"]["getSystemSettingByKey"]["items"]
+    except (KeyError, TypeError):
+        items = []
     return items[0] if items else None
 
-def get_user_transactions(user_transactions_id: str):
-    """Fetches a user's transaction record to get their balance."""
-    query = """
-    query GetUserTransactions($id: ID!) {
-      getUserTransactions(id: $id) {
-        id
-        creditBalance
-        _version
-      }
-    }
-    """
-    variables = {"id": user_transactions_id}
-    response = execute_graphql_request(query, variables)
-    return response.get("data", {}).get("getUserTransactions")
-
 def create_user_transactions(user_id: str, email: str, initial_balance: float, owner: str):
     """Creates a new user transactions record with initial credit balance."""
-    mutation = """
-    mutation CreateUserTransactions($input: CreateUserTransactionsInput!) {
-      createUserTransactions(input: $input) {
-        id
-        email
-        creditBalance
-        owner
-        _version
-      }
-    }
-    """
     variables = {"input": {"id": user_id, "email": email, "creditBalance": initial_balance, "owner": owner}}
-    return execute_graphql_request(mutation, variables)
+    return execute_graphql_request(CREATE_USER_TRANSACTIONS_MUTATION, variables)
+
+def is_duplicate_record_error(errors) -> bool:
+    """True when every GraphQL error is the conditional-create failure for an existing record."""
+    return bool(errors) and all(err.get('errorType') == DUPLICATE_RECORD_ERROR_TYPE for err in errors)
 
 # --- Main Lambda Handler ---
 def lambda_handler(event, context):
     """
     AWS Lambda handler for adding credits, invoked by Cognito post-confirmation trigger.
     """
-    print(f"💰 init-credits Lambda started. Event: {json.dumps(event)}")
+    # Cognito also fires this trigger for forgot-password confirmations; return
+    # those unchanged before doing any other work
+    trigger_source = event.get('triggerSource')
+    if trigger_source != 'PostConfirmation_ConfirmSignUp':
+        print(f"⚠️ Ignoring trigger source: {trigger_source}")
+        return event  # Return the event unchanged for Cognito triggers
+
+    print(f"💰 init-credits Lambda started. Trigger: {trigger_source}, user: {event.get('userName')}")
+    if DEBUG:
+        print(f"Event: {orjson.dumps(event).decode('utf-8')}")
 
     try:
         # Cognito post-confirmation trigger event structure
-        user_pool_id = event.get('userPoolId')
         user_name = event.get('userName')  # This is the user's unique ID
-        trigger_source = event.get('triggerSource')
-        
+
         # Extract email and user ID from user attributes
         user_attributes = event.get('request', {}).get('userAttributes', {})
         email = user_attributes.get('email')
         user_id = user_attributes.get('sub')  # The actual UUID for the user
         
-        # Only process post-confirmation events
-        if trigger_source != 'PostConfirmation_ConfirmSignUp':
-            print(f"⚠️ Ignoring trigger source: {trigger_source}")
-            return event  # Return the event unchanged for Cognito triggers
-        
         if not user_id:
             raise Exception("sub (user ID) is missing from the Cognito event user attributes.")
             
@@ -130,20 +201,18 @@ def lambda_handler(event, context):
         except (ValueError, TypeError):
              raise Exception("Invalid value for STARTING_CREDITS setting.")
 
-        # Check if UserTransactions record already exists (idempotency check)
         user_transactions_id = user_id  # Use the actual user UUID, not the username
-        existing_user_tx = get_user_transactions(user_transactions_id)
-        
-        if existing_user_tx:
-            print(f"⚠️ User transaction record already exists for ID: {user_transactions_id}. Skipping creation to avoid duplicates.")
-            return event
 
         # Create owner field in format UUID:username
         owner = f"{user_id}:{user_name}"
         
-        # Create new UserTransactions record with initial credits
+        # Create new UserTransactions record with initial credits. The create is
+        # conditional on the id not existing, which doubles as the idempotency check.
         print(f"💾 Creating new UserTransactions record with {initial_credits} credits...")
         create_response = create_user_transactions(user_transactions_id, email, initial_credits, owner)
+        if is_duplicate_record_error(create_response.get("errors")):
+            print(f"⚠️ User transaction record already exists for ID: {user_transactions_id}. Skipping creation to avoid duplicates.")
+            return event
         if "errors" in create_response and create_response["errors"]:
             raise Exception(f"Failed to create user transactions record: {create_response['errors']}")
 
@@ -152,8 +221,8 @@ def lambda_handler(event, context):
         return event
 
     except Exception as e:
-        import traceback
-        print(f"❌ init-credits failed: {e}\n{traceback.format_exc()}")
+        print(f"❌ init-credits failed: {e}")
+        traceback.print_exc()
         # For Cognito triggers, we should still return the event to not break the user flow
         # The user registration should succeed even if credit initialization fails
         print("⚠️ Returning event despite failure to allow user registration to complete.")
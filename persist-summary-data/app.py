@@ -1,17 +1,29 @@
 # --- Standard Library Imports ---
 import os
 import json
+import threading
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Optional, Dict, Any
 
 # --- Third-party Library Imports ---
-import requests
+import orjson
+import urllib3
 import boto3
+from botocore.config import Config
 
 # --- CONFIGURATION ---
 APPSYNC_API_URL = os.environ.get('APPSYNC_API_URL')
 APPSYNC_API_KEY_FROM_ENV = os.environ.get('APPSYNC_API_KEY')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-2')
+APPSYNC_MAX_WORKERS = 16  # Must not exceed the AppSync connection pool's maxsize
+S3_MAX_POOL_CONNECTIONS = 32
+MUTATIONS_PER_REQUEST = 25  # Aliased mutations per GraphQL document
+SESSION_LINKS_PAGE_LIMIT = 1000  # AppSync's per-page maximum; most sessions fit in one page
+SESSION_LINKS_MAX_PAGES = 25
+ERROR_UPDATE_WAIT_SECONDS = 2.0  # Max time the error path waits on the best-effort ERROR status write
 
 # --- VALIDATE ESSENTIAL CONFIGURATION ---
 if not APPSYNC_API_URL:
@@ -20,7 +32,29 @@ if not APPSYNC_API_KEY_FROM_ENV:
     raise ValueError("Environment variable APPSYNC_API_KEY not set!")
 
 # --- AWS CLIENTS ---
-s3_client = boto3.client("s3", region_name=AWS_REGION)
+s3_client = boto3.client(
+    "s3",
+    region_name=AWS_REGION,
+    config=Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={"mode": "adaptive", "max_attempts": 5},
+        tcp_keepalive=True
+    )
+)
+
+# Pooled AppSync connections reused across calls and warm invocations. POST is not
+# in Retry's default allowed_methods, so only connection failures are retried and a
+# createSegment that reached AppSync is never replayed.
+appsync_http = urllib3.PoolManager(
+    num_pools=1,
+    maxsize=32,
+    retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504]),
+    timeout=urllib3.Timeout(connect=5.0, read=90.0)
+)
+APPSYNC_HEADERS = {
+    'Content-Type': 'application/json',
+    'x-api-key': APPSYNC_API_KEY_FROM_ENV
+}
 
 # --- GraphQL Mutations ---
 GET_SESSION_QUERY = """
@@ -48,19 +82,27 @@ mutation UpdateSession($input: UpdateSessionInput!, $condition: ModelSessionCond
 }
 """
 
-CREATE_SEGMENT_MUTATION = """
-mutation CreateSegment($input: CreateSegmentInput!) {
-  createSegment(input: $input) {
-    id
-    title
-    description
-    image
-    index
-    sessionSegmentsId
-    owner
-    createdAt
-    updatedAt
-    _version
+# Selection sets for the aliased mutations sent by execute_batched_mutations
+SEGMENT_FIELDS = "id title description image index sessionSegmentsId owner createdAt updatedAt _version"
+SESSION_ADVENTURERS_FIELDS = "id _version sessionId adventurerId updatedAt"
+SESSION_NPCS_FIELDS = "id _version sessionId nPCId updatedAt"
+SESSION_LOCATIONS_FIELDS = "id _version sessionId locationId updatedAt"
+
+# First page of the needed link listings in one request; fetch_session_links
+# follows any remaining pages with the per-type queries below
+LIST_SESSION_LINKS_QUERY = """
+query ListSessionLinks($sessionId: ID!, $limit: Int, $withAdventurers: Boolean!, $withNpcs: Boolean!, $withLocations: Boolean!) {
+  adventurers: listSessionAdventurers(filter: {sessionId: {eq: $sessionId}}, limit: $limit) @include(if: $withAdventurers) {
+    items { id _version sessionId adventurerId }
+    nextToken
+  }
+  npcs: listSessionNpcs(filter: {sessionId: {eq: $sessionId}}, limit: $limit) @include(if: $withNpcs) {
+    items { id _version sessionId nPCId }
+    nextToken
+  }
+  locations: listSessionLocations(filter: {sessionId: {eq: $sessionId}}, limit: $limit) @include(if: $withLocations) {
+    items { id _version sessionId locationId }
+    nextToken
   }
 }
 """
@@ -92,30 +134,6 @@ query ListSessionLocations($filter: ModelSessionLocationsFilterInput, $limit: In
 }
 """
 
-UPDATE_SESSION_ADVENTURERS_MUTATION = """
-mutation UpdateSessionAdventurers($input: UpdateSessionAdventurersInput!, $condition: ModelSessionAdventurersConditionInput) {
-  updateSessionAdventurers(input: $input, condition: $condition) {
-    id _version sessionId adventurerId updatedAt
-  }
-}
-"""
-
-UPDATE_SESSION_NPCS_MUTATION = """
-mutation UpdateSessionNpcs($input: UpdateSessionNpcsInput!, $condition: ModelSessionNpcsConditionInput) {
-  updateSessionNpcs(input: $input, condition: $condition) {
-    id _version sessionId nPCId updatedAt
-  }
-}
-"""
-
-UPDATE_SESSION_LOCATIONS_MUTATION = """
-mutation UpdateSessionLocations($input: UpdateSessionLocationsInput!, $condition: ModelSessionLocationsConditionInput) {
-  updateSessionLocations(input: $input, condition: $condition) {
-    id _version sessionId locationId updatedAt
-  }
-}
-"""
-
 SEND_PUSH_NOTIFICATION_MUTATION = """
 mutation SendPushNotification($input: SendPushNotificationInput!) {
   sendPushNotification(input: $input) {
@@ -129,84 +147,159 @@ mutation SendPushNotification($input: SendPushNotificationInput!) {
 
 
 # --- AppSync Helper Function ---
+@lru_cache(maxsize=64)
+def graphql_query_prefix(query: str) -> bytes:
+    """JSON-encoded '{"query": ...' with the closing brace dropped, encoded once per query string."""
+    return orjson.dumps({"query": query})[:-1]
+
+
 def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Executes a GraphQL query/mutation against AppSync."""
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': APPSYNC_API_KEY_FROM_ENV
-    }
-    payload = {"query": query, "variables": variables or {}}
+    body = graphql_query_prefix(query) + b',"variables":' + orjson.dumps(variables or {}) + b'}'
 
     try:
-        response = requests.post(APPSYNC_API_URL, headers=headers, json=payload, timeout=90)
-        response.raise_for_status()
-        response_json = response.json()
+        response = appsync_http.request('POST', APPSYNC_API_URL, body=body, headers=APPSYNC_HEADERS)
+        if response.status >= 400:
+            raise urllib3.exceptions.HTTPError(f"{response.status} Error for url: {APPSYNC_API_URL}")
+        response_json = orjson.loads(response.data)
         if "errors" in response_json:
-            print(f"GraphQL Error: {json.dumps(response_json['errors'], indent=2)}")
+            print("GraphQL Error:", response_json["errors"])
         return response_json
-    except requests.exceptions.RequestException as e:
+    except (urllib3.exceptions.HTTPError, orjson.JSONDecodeError) as e:
         print(f"Error making AppSync request: {e}")
         return {"errors": [{"message": str(e)}]}
 
 
-def send_push_notification(user_id: str, title: str, body: str, data: dict = None, channel_id: str = "sessions"):
-    """Send a push notification to a user."""
-    variables = {
-        "input": {
-            "userId": user_id,
-            "title": title,
-            "body": body,
-            "data": json.dumps(data) if data else None,
-            "channelId": channel_id
-        }
+def collect_entity_ids(entities: List[Dict[str, Any]]) -> List[str]:
+    """Unique entity IDs in first-mention order, skipping entries without an ID."""
+    seen = {}
+    for entity in entities:
+        entity_id = entity.get("id")
+        if entity_id:
+            seen[entity_id] = None
+    return list(seen)
+
+
+def read_narrative_summary(s3_bucket: str, key: str) -> Dict[str, Any]:
+    """Read and parse the narrative summary JSON from S3."""
+    summary_obj = s3_client.get_object(Bucket=s3_bucket, Key=key)
+    return orjson.loads(summary_obj['Body'].read())
+
+
+def build_push_notification_input(user_id: str, title: str, body: str, data: dict = None, channel_id: str = "sessions") -> Dict[str, Any]:
+    """Build the SendPushNotificationInput for a user."""
+    return {
+        "userId": user_id,
+        "title": title,
+        "body": body,
+        "data": json.dumps(data) if data else None,
+        "channelId": channel_id
     }
-    
-    response = execute_graphql_request(SEND_PUSH_NOTIFICATION_MUTATION, variables)
-    
-    if "errors" in response:
-        raise Exception(f"Push notification error: {response['errors']}")
-    
-    result = response.get("data", {}).get("sendPushNotification", {})
+
+
+def check_push_notification_result(result: Optional[Dict[str, Any]], errors: Optional[List[Dict[str, Any]]] = None):
+    """Raise if a sendPushNotification result did not succeed."""
+    if not result:
+        raise Exception(f"Push notification error: {errors}")
     if not result.get("success"):
         raise Exception(f"Push notification failed: {result.get('error') or result.get('message')}")
-    
     print(f"Push notification sent. Ticket ID: {result.get('ticketId')}")
-    return response
 
 
-def fetch_session_links(query_str: str, list_key: str, session_id: str) -> List[Dict[str, Any]]:
-    """Fetch existing session link records (adventurers, NPCs, locations)."""
+def fetch_session_links(query_str: str, list_key: str, session_id: str, next_token: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Fetch existing session link records (adventurers, NPCs, locations), optionally resuming from next_token."""
     items = []
-    next_token = None
-    max_pages = 25
+    variables = {
+        "filter": {"sessionId": {"eq": session_id}},
+        "limit": SESSION_LINKS_PAGE_LIMIT,
+        "nextToken": next_token
+    }
+    pages = 0
     
-    for _ in range(max_pages):
-        variables = {
-            "filter": {"sessionId": {"eq": session_id}},
-            "limit": 100,
-            "nextToken": next_token
-        }
+    while pages < SESSION_LINKS_MAX_PAGES:
         resp = execute_graphql_request(query_str, variables)
-        data = resp.get("data", {})
-        page = data.get(list_key) or {}
+        page = (resp.get("data") or {}).get(list_key) or {}
         items.extend(page.get("items", []))
-        next_token = page.get("nextToken")
-        if not next_token:
+        pages += 1
+        variables["nextToken"] = page.get("nextToken")
+        if not variables["nextToken"]:
             break
     
     return items
 
 
-def update_link_item(mutation_str: str, item: Dict, id_field_name: str, session_id: str, entity_id: str) -> bool:
-    """Update a session link record with an entity ID."""
-    update_input = {
-        "id": item["id"],
-        "_version": item["_version"],
+def execute_batched_mutations(operations: List[tuple]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Send mutations as aliased root fields of a few GraphQL documents instead of one
+    request each. `operations` is a list of (field name, input type, selection set,
+    input) tuples. Returns the result record (or None on failure) for each operation,
+    in order. Chunks of MUTATIONS_PER_REQUEST are sent concurrently.
+    """
+    def run_chunk(chunk):
+        var_defs = ", ".join(f"$input{i}: {input_type}!" for i, (_, input_type, _, _) in enumerate(chunk))
+        fields = "\n".join(
+            f"  m{i}: {field_name}(input: $input{i}) {{ {selection} }}"
+            for i, (field_name, _, selection, _) in enumerate(chunk)
+        )
+        document = f"mutation BatchedMutations({var_defs}) {{\n{fields}\n}}"
+        response = execute_graphql_request(document, {f"input{i}": op[3] for i, op in enumerate(chunk)})
+        data = response.get("data") or {}
+        return [data.get(f"m{i}") for i in range(len(chunk))]
+
+    chunks = [operations[i:i + MUTATIONS_PER_REQUEST] for i in range(0, len(operations), MUTATIONS_PER_REQUEST)]
+    if not chunks:
+        return []
+    with ThreadPoolExecutor(max_workers=min(APPSYNC_MAX_WORKERS, len(chunks))) as executor:
+        chunk_results = list(executor.map(run_chunk, chunks))
+    return [record for chunk_result in chunk_results for record in chunk_result]
+
+
+def fetch_all_session_links(session_id: str, with_adventurers: bool, with_npcs: bool, with_locations: bool) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Fetch adventurer, NPC and location link records for a session, keyed by type.
+    Types that are not requested come back empty without being queried.
+    """
+    links = {"adventurers": [], "npcs": [], "locations": []}
+    if not (with_adventurers or with_npcs or with_locations):
+        return links
+
+    variables = {
         "sessionId": session_id,
-        id_field_name: entity_id
+        "limit": SESSION_LINKS_PAGE_LIMIT,
+        "withAdventurers": with_adventurers,
+        "withNpcs": with_npcs,
+        "withLocations": with_locations
     }
-    resp = execute_graphql_request(mutation_str, {"input": update_input})
-    return resp.get("data") is not None and any(v is not None for v in resp.get("data", {}).values())
+    resp = execute_graphql_request(LIST_SESSION_LINKS_QUERY, variables)
+    data = resp.get("data") or {}
+    for alias, query_str, list_key in (
+        ("adventurers", LIST_SESSION_ADVENTURERS_QUERY, "listSessionAdventurers"),
+        ("npcs", LIST_SESSION_NPCS_QUERY, "listSessionNpcs"),
+        ("locations", LIST_SESSION_LOCATIONS_QUERY, "listSessionLocations"),
+    ):
+        page = data.get(alias) or {}
+        links[alias] = list(page.get("items", []))
+        if page.get("nextToken"):
+            links[alias].extend(fetch_session_links(query_str, list_key, session_id, page["nextToken"]))
+    return links
+
+
+def mark_session_error(session_id: str, version: int, error_message: str):
+    """Best-effort update of the session to ERROR status."""
+    try:
+        error_update_input = {
+            "id": session_id,
+            "_version": version,
+            "transcriptionStatus": "ERROR",
+            "errorMessage": error_message[:1000]
+        }
+        error_response = execute_graphql_request(UPDATE_SESSION_MUTATION, {"input": error_update_input})
+        if (error_response.get("data") or {}).get("updateSession"):
+            print("Session status updated to ERROR")
+        else:
+            print(f"Failed to update session to ERROR: {error_response.get('errors')}")
+    except Exception as update_err:
+        print(f"Could not update session to ERROR: {update_err}")
 
 
 def lambda_handler(event, context):
@@ -239,17 +332,14 @@ def lambda_handler(event, context):
         entity_mentions = event.get("entityMentions", {})
         generate_name = event.get("generateName", False)
         
-        # Read narrative summary from S3
+        # Read the narrative summary from S3 while fetching the current session state;
+        # the session read doubles as the idempotency check so it cannot be skipped
         print(f"Reading narrative summary: {narrative_summary_key}")
-        summary_obj = s3_client.get_object(Bucket=s3_bucket, Key=narrative_summary_key)
-        summary_content = json.loads(summary_obj['Body'].read().decode('utf-8'))
-        
-        tldr = summary_content.get("tldr", "")
-        segments = summary_content.get("sessionSegments", [])
-        
-        # Fetch current session state
         print(f"Fetching session: {session_id}")
-        session_response = execute_graphql_request(GET_SESSION_QUERY, {"id": session_id})
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            summary_future = executor.submit(read_narrative_summary, s3_bucket, narrative_summary_key)
+            session_response = execute_graphql_request(GET_SESSION_QUERY, {"id": session_id})
+            summary_error = summary_future.exception()
         
         if "errors" in session_response and not session_response.get("data"):
             raise Exception(f"Error fetching session: {session_response['errors']}")
@@ -260,7 +350,8 @@ def lambda_handler(event, context):
         
         session_version = session_info["_version"]
         
-        # Check idempotency
+        # Check idempotency before surfacing any S3 failure, so a replay against a
+        # finished session never reaches the ERROR write in the except path
         current_status = session_info.get("transcriptionStatus")
         if current_status in ["READ", "ERROR"]:
             print(f"Session already has status '{current_status}'. Skipping to prevent duplicates.")
@@ -272,38 +363,37 @@ def lambda_handler(event, context):
                 "creditsToRefund": event.get("creditsToRefund")
             }
         
+        if summary_error:
+            raise summary_error
+        summary_content = summary_future.result()
+        tldr = summary_content.get("tldr", "")
+        segments = summary_content.get("sessionSegments", [])
+        
         # --- Create Segments ---
         print(f"Creating {len(segments)} segments")
         processing_errors = []
         created_segments_count = 0
         
+        # Segments carry their own index, so they can be created as aliased
+        # mutations in a handful of requests instead of one request each
+        segment_operations = []
         for idx, segment in enumerate(segments):
-            try:
-                # Get corresponding image key
-                segment_image_key = image_keys[idx] if idx < len(image_keys) else None
-                
-                create_segment_input = {
-                    "sessionSegmentsId": session_id,
-                    "title": segment.get("title", f"Segment {idx + 1}"),
-                    "description": [segment.get("description", "")] if segment.get("description") else [],
-                    "image": segment_image_key,
-                    "owner": owner,
-                    "index": idx
-                }
-                
-                segment_response = execute_graphql_request(CREATE_SEGMENT_MUTATION, {"input": create_segment_input})
-                created_record = segment_response.get("data", {}).get("createSegment")
-                
-                if created_record:
-                    created_segments_count += 1
-                    print(f"✅ Created segment {idx + 1}: '{segment.get('title')}'")
-                else:
-                    err_msg = f"Failed to create segment '{segment.get('title')}'"
-                    print(f"❌ {err_msg}")
-                    processing_errors.append(err_msg)
-                    
-            except Exception as e:
-                err_msg = f"Exception creating segment {idx + 1}: {e}"
+            create_segment_input = {
+                "sessionSegmentsId": session_id,
+                "title": segment.get("title", f"Segment {idx + 1}"),
+                "description": [segment.get("description", "")] if segment.get("description") else [],
+                "image": image_keys[idx] if idx < len(image_keys) else None,
+                "owner": owner,
+                "index": idx
+            }
+            segment_operations.append(("createSegment", "CreateSegmentInput", SEGMENT_FIELDS, create_segment_input))
+        
+        for idx, (segment, created_record) in enumerate(zip(segments, execute_batched_mutations(segment_operations))):
+            if created_record:
+                created_segments_count += 1
+                print(f"✅ Created segment {idx + 1}: '{segment.get('title')}'")
+            else:
+                err_msg = f"Failed to create segment '{segment.get('title')}'"
                 print(f"❌ {err_msg}")
                 processing_errors.append(err_msg)
         
@@ -317,65 +407,60 @@ def lambda_handler(event, context):
         existing_npcs = entity_mentions.get("existingNPCs", [])
         existing_locations = entity_mentions.get("existingLocations", [])
         
-        adventurer_ids = sorted({e["id"] for e in existing_adventurers if e.get("id")})
-        npc_ids = sorted({e["id"] for e in existing_npcs if e.get("id")})
-        location_ids = sorted({e["id"] for e in existing_locations if e.get("id")})
+        adventurer_ids = collect_entity_ids(existing_adventurers)
+        npc_ids = collect_entity_ids(existing_npcs)
+        location_ids = collect_entity_ids(existing_locations)
         
         print(f"Linking: {len(adventurer_ids)} adventurers, {len(npc_ids)} NPCs, {len(location_ids)} locations")
         
         try:
-            # Fetch existing link records
-            existing_adv_items = fetch_session_links(LIST_SESSION_ADVENTURERS_QUERY, "listSessionAdventurers", session_id)
-            existing_npc_items = fetch_session_links(LIST_SESSION_NPCS_QUERY, "listSessionNpcs", session_id)
-            existing_loc_items = fetch_session_links(LIST_SESSION_LOCATIONS_QUERY, "listSessionLocations", session_id)
+            # Fetch existing link records in one request, skipping types with nothing to link
+            session_links = fetch_all_session_links(session_id, bool(adventurer_ids), bool(npc_ids), bool(location_ids))
+            existing_adv_items = session_links["adventurers"]
+            existing_npc_items = session_links["npcs"]
+            existing_loc_items = session_links["locations"]
             
             # Build maps of already-linked entities and placeholders
             adv_by_entity = {it.get("adventurerId"): it for it in existing_adv_items if it.get("adventurerId")}
             npc_by_entity = {it.get("nPCId"): it for it in existing_npc_items if it.get("nPCId")}
             loc_by_entity = {it.get("locationId"): it for it in existing_loc_items if it.get("locationId")}
             
-            adv_placeholders = [it for it in existing_adv_items if not it.get("adventurerId")]
-            npc_placeholders = [it for it in existing_npc_items if not it.get("nPCId")]
-            loc_placeholders = [it for it in existing_loc_items if not it.get("locationId")]
+            adv_placeholders = deque(it for it in existing_adv_items if not it.get("adventurerId"))
+            npc_placeholders = deque(it for it in existing_npc_items if not it.get("nPCId"))
+            loc_placeholders = deque(it for it in existing_loc_items if not it.get("locationId"))
             
-            # Link adventurers
-            for adv_id in adventurer_ids:
-                if adv_id in adv_by_entity:
-                    continue
-                if adv_placeholders:
-                    item = adv_placeholders.pop(0)
-                    if update_link_item(UPDATE_SESSION_ADVENTURERS_MUTATION, item, "adventurerId", session_id, adv_id):
-                        print(f"✅ Linked adventurer {adv_id}")
+            # Assign placeholders sequentially, then send the link updates as batched aliased mutations
+            link_work = []  # (label, entity id)
+            link_operations = []
+            for label, entity_ids, by_entity, placeholders, field_name, input_type, selection, id_field_name in (
+                ("adventurer", adventurer_ids, adv_by_entity, adv_placeholders,
+                 "updateSessionAdventurers", "UpdateSessionAdventurersInput", SESSION_ADVENTURERS_FIELDS, "adventurerId"),
+                ("NPC", npc_ids, npc_by_entity, npc_placeholders,
+                 "updateSessionNpcs", "UpdateSessionNpcsInput", SESSION_NPCS_FIELDS, "nPCId"),
+                ("location", location_ids, loc_by_entity, loc_placeholders,
+                 "updateSessionLocations", "UpdateSessionLocationsInput", SESSION_LOCATIONS_FIELDS, "locationId"),
+            ):
+                for entity_id in entity_ids:
+                    if entity_id in by_entity:
+                        continue
+                    if placeholders:
+                        item = placeholders.popleft()
+                        update_input = {
+                            "id": item["id"],
+                            "_version": item["_version"],
+                            "sessionId": session_id,
+                            id_field_name: entity_id
+                        }
+                        link_work.append((label, entity_id))
+                        link_operations.append((field_name, input_type, selection, update_input))
                     else:
-                        processing_errors.append(f"Failed to link adventurer {adv_id}")
-                else:
-                    print(f"⚠️ No placeholder for adventurer {adv_id}")
+                        print(f"⚠️ No placeholder for {label} {entity_id}")
             
-            # Link NPCs
-            for npc_id in npc_ids:
-                if npc_id in npc_by_entity:
-                    continue
-                if npc_placeholders:
-                    item = npc_placeholders.pop(0)
-                    if update_link_item(UPDATE_SESSION_NPCS_MUTATION, item, "nPCId", session_id, npc_id):
-                        print(f"✅ Linked NPC {npc_id}")
-                    else:
-                        processing_errors.append(f"Failed to link NPC {npc_id}")
+            for (label, entity_id), linked_record in zip(link_work, execute_batched_mutations(link_operations)):
+                if linked_record:
+                    print(f"✅ Linked {label} {entity_id}")
                 else:
-                    print(f"⚠️ No placeholder for NPC {npc_id}")
-            
-            # Link locations
-            for loc_id in location_ids:
-                if loc_id in loc_by_entity:
-                    continue
-                if loc_placeholders:
-                    item = loc_placeholders.pop(0)
-                    if update_link_item(UPDATE_SESSION_LOCATIONS_MUTATION, item, "locationId", session_id, loc_id):
-                        print(f"✅ Linked location {loc_id}")
-                    else:
-                        processing_errors.append(f"Failed to link location {loc_id}")
-                else:
-                    print(f"⚠️ No placeholder for location {loc_id}")
+                    processing_errors.append(f"Failed to link {label} {entity_id}")
                     
         except Exception as e:
             err_msg = f"Exception linking entities: {e}"
@@ -401,10 +486,10 @@ def lambda_handler(event, context):
         
         final_update_response = execute_graphql_request(UPDATE_SESSION_MUTATION, {"input": final_update_input})
         
-        if "errors" in final_update_response and not final_update_response.get("data", {}).get("updateSession"):
+        if "errors" in final_update_response and not (final_update_response.get("data") or {}).get("updateSession"):
             raise Exception(f"Failed to update session: {final_update_response['errors']}")
         
-        updated_session = final_update_response.get("data", {}).get("updateSession")
+        updated_session = (final_update_response.get("data") or {}).get("updateSession")
         if not updated_session or "_version" not in updated_session:
             raise Exception("Session update returned no data")
         
@@ -412,6 +497,8 @@ def lambda_handler(event, context):
         print("✅ Session updated to READ status")
         
         # --- Send Push Notification ---
+        # Only sent once the READ update has been confirmed above; in a combined request
+        # GraphQL would still run the push after a failed update
         user_id_for_notification = None
         if owner:
             user_id_for_notification = owner.split(":")[0] if ":" in owner else owner
@@ -419,13 +506,18 @@ def lambda_handler(event, context):
         if user_id_for_notification:
             try:
                 print(f"Sending push notification to user: {user_id_for_notification}")
-                send_push_notification(
+                push_input = build_push_notification_input(
                     user_id=user_id_for_notification,
                     title="Session Ready",
                     body="Your session has been processed and is ready to view!",
                     data={"type": "session_complete", "sessionId": session_id},
                     channel_id="sessions"
                 )
+                push_response = execute_graphql_request(SEND_PUSH_NOTIFICATION_MUTATION, {"input": push_input})
+                check_push_notification_result(
+                    (push_response.get("data") or {}).get("sendPushNotification"),
+                    push_response.get("errors")
+                )
                 print("✅ Push notification sent")
             except Exception as push_err:
                 print(f"⚠️ Push notification failed (non-critical): {push_err}")
@@ -451,23 +543,15 @@ def lambda_handler(event, context):
         print(f"ERROR: {error_message}")
         traceback.print_exc()
         
-        # Try to update session to ERROR state
+        # Try to update session to ERROR state without letting a slow AppSync call
+        # hold up the failure response; the write usually finishes even if the wait lapses
         if session_info and 'id' in session_info:
-            try:
-                version = updated_session_version if updated_session_version else session_info.get('_version', 1)
-                error_update_input = {
-                    "id": session_info['id'],
-                    "_version": version,
-                    "transcriptionStatus": "ERROR",
-                    "errorMessage": error_message[:1000]
-                }
-                error_response = execute_graphql_request(UPDATE_SESSION_MUTATION, {"input": error_update_input})
-                if error_response.get("data", {}).get("updateSession"):
-                    print("Session status updated to ERROR")
-                else:
-                    print(f"Failed to update session to ERROR: {error_response.get('errors')}")
-            except Exception as update_err:
-                print(f"Could not update session to ERROR: {update_err}")
+            version = updated_session_version if updated_session_version else session_info.get('_version', 1)
+            error_thread = threading.Thread(target=mark_session_error, args=(session_info['id'], version, error_message))
+            error_thread.start()
+            error_thread.join(timeout=ERROR_UPDATE_WAIT_SECONDS)
+            if error_thread.is_alive():
+                print(f"ERROR status update still in flight after {ERROR_UPDATE_WAIT_SECONDS}s; returning anyway")
         
         return {
             "statusCode": 500,
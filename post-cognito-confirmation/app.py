@@ -1,32 +1,36 @@
 from __future__ import print_function
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any
 
 import requests
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
+from requests.adapters import HTTPAdapter
 from pprint import pprint
 
 # --- Global Variables ---
 APPSYNC_API_URL = os.environ.get('APPSYNC_API_URL')
 APPSYNC_API_KEY = os.environ.get('APPSYNC_API_KEY')
 
+# Reused across warm invocations so AppSync calls skip the TCP/TLS handshake
+appsync_session = requests.Session()
+appsync_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+appsync_session.headers.update({
+    'Content-Type': 'application/json',
+    'x-api-key': APPSYNC_API_KEY or ''
+})
+
 # --- AppSync Helper Function ---
 def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Executes a GraphQL query/mutation against the AppSync endpoint."""
     if not APPSYNC_API_URL or not APPSYNC_API_KEY:
         raise ValueError("APPSYNC_API_URL and APPSYNC_API_KEY environment variables must be set.")
 
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': APPSYNC_API_KEY
-    }
     payload = {"query": query, "variables": variables or {}}
 
     try:
         print(f"Executing AppSync request with payload: {json.dumps(payload)}")
-        response = requests.post(APPSYNC_API_URL, headers=headers, json=payload, timeout=30)
+        response = appsync_session.post(APPSYNC_API_URL, json=payload, timeout=30)
         response.raise_for_status()
         response_json = response.json()
         print(f"Received AppSync response: {json.dumps(response_json)}")
@@ -135,12 +139,26 @@ def initialize_user_credits(event):
     print("Credits initialized successfully.")
 
 # --- Brevo Contact Creation ---
+# Built on first use and kept for warm invocations so the SDK's connection pool is reused
+brevo_contacts_api = None
+
+def get_brevo_contacts_api():
+    """Returns the shared Brevo ContactsApi, creating it on first use."""
+    global brevo_contacts_api
+    if brevo_contacts_api is None:
+        import sib_api_v3_sdk
+        configuration = sib_api_v3_sdk.Configuration()
+        configuration.api_key['api-key'] = os.environ['BREVO_API_KEY']
+        brevo_contacts_api = sib_api_v3_sdk.ContactsApi(sib_api_v3_sdk.ApiClient(configuration))
+    return brevo_contacts_api
+
 def create_brevo_contact(email, username):
     """Create a contact in Brevo."""
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = os.environ['BREVO_API_KEY']
+    # Imported here so cold starts that return early never load the Brevo SDK
+    import sib_api_v3_sdk
+    from sib_api_v3_sdk.rest import ApiException
 
-    api_instance = sib_api_v3_sdk.ContactsApi(sib_api_v3_sdk.ApiClient(configuration))
+    api_instance = get_brevo_contacts_api()
     create_contact = sib_api_v3_sdk.CreateContact(
         email=email,
         attributes={"USERNAME": username},
@@ -156,13 +174,14 @@ def create_brevo_contact(email, username):
 
 # --- Main Lambda Handler ---
 def handler(event, context):
-    print(event)
-
+    # Forgot-password confirmations also fire this trigger; return them before doing any work
     trigger_source = event.get('triggerSource')
     if trigger_source != 'PostConfirmation_ConfirmSignUp':
         print(f"Ignoring trigger source: {trigger_source}")
         return event
 
+    print(event)
+
     user_attributes = event['request']['userAttributes']
     email = user_attributes.get('email')
     username = event['userName']
@@ -171,16 +190,20 @@ def handler(event, context):
         print("Email not found in user attributes")
         return event
 
-    # Initialize credits for the new user
-    try:
-        initialize_user_credits(event)
-    except Exception as e:
-        print(f"Failed to initialize credits: {e}")
-
-    # Create Brevo contact
-    try:
-        create_brevo_contact(email, username)
-    except Exception as e:
-        print(f"Failed to create Brevo contact: {e}")
+    # Credit initialization (AppSync) and Brevo contact creation are independent,
+    # so run them side by side; each failure is reported on its own
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        credits_future = executor.submit(initialize_user_credits, event)
+        brevo_future = executor.submit(create_brevo_contact, email, username)
+
+        try:
+            credits_future.result()
+        except Exception as e:
+            print(f"Failed to initialize credits: {e}")
+
+        try:
+            brevo_future.result()
+        except Exception as e:
+            print(f"Failed to create Brevo contact: {e}")
 
     return event
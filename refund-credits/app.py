@@ -1,14 +1,41 @@
 # --- Standard Library Imports ---
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any
 
 # --- Third-party Library Imports ---
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- Global Variables ---
 APPSYNC_API_URL = os.environ.get('APPSYNC_API_URL')
 APPSYNC_API_KEY = os.environ.get('APPSYNC_API_KEY')
+LOG_PAYLOAD_MAX_BYTES = 2000  # Larger request/response bodies are logged by size only
+
+# Pooled AppSync session reused across calls and warm invocations. Only throttled
+# (429) responses and failures to connect are retried. read=0/other=0 stop urllib3
+# from replaying a POST after a read timeout or dropped response, and 5xx is not
+# retried either: the request may already have applied the balance update or
+# created the refund transaction, and replaying those is unsafe.
+appsync_session = requests.Session()
+appsync_session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, read=0, other=0, backoff_factor=0.2, status_forcelist=[429], allowed_methods=["POST"])
+))
+appsync_session.headers.update({
+    'Content-Type': 'application/json',
+    'x-api-key': APPSYNC_API_KEY or ''
+})
+
+def format_payload_for_log(payload: bytes) -> str:
+    """Returns the payload as text, or just its size if it is too large to log."""
+    if len(payload) <= LOG_PAYLOAD_MAX_BYTES:
+        return payload.decode('utf-8')
+    return f"<{len(payload)} bytes>"
 
 # --- AppSync Helper Function ---
 def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -18,22 +45,18 @@ def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = No
     if not APPSYNC_API_URL or not APPSYNC_API_KEY:
         raise ValueError("APPSYNC_API_URL and APPSYNC_API_KEY environment variables must be set.")
 
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': APPSYNC_API_KEY
-    }
-    payload = {"query": query, "variables": variables or {}}
+    payload = orjson.dumps({"query": query, "variables": variables or {}})
 
     try:
-        print(f"Executing AppSync request with payload: {json.dumps(payload)}")
-        response = requests.post(APPSYNC_API_URL, headers=headers, json=payload, timeout=30)
+        print(f"Executing AppSync request with payload: {format_payload_for_log(payload)}")
+        response = appsync_session.post(APPSYNC_API_URL, data=payload, timeout=30)
         response.raise_for_status()
-        response_json = response.json()
-        print(f"Received AppSync response: {json.dumps(response_json)}")
+        print(f"Received AppSync response: {format_payload_for_log(response.content)}")
+        response_json = orjson.loads(response.content)
         if "errors" in response_json and response_json["errors"]:
             print(f"[ERROR] GraphQL errors: {response_json['errors']}")
         return response_json
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         print(f"[ERROR] Error making AppSync request: {e}")
         return {"errors": [{"message": str(e)}]}
 
@@ -68,17 +91,25 @@ def update_user_transactions(user_transactions_id: str, new_balance: float, vers
     variables = {"input": {"id": user_transactions_id, "creditBalance": new_balance, "_version": version}}
     return execute_graphql_request(mutation, variables)
 
-def create_refund_transaction(user_transactions_id: str, session_id: str, credits_refunded: float):
-    """Creates a transaction record for the credits refunded."""
+def record_refund(user_transactions_id: str, session_id: str, credits_refunded: float, session_version: int):
+    """
+    Creates the refund transaction record and marks the session REFUNDED in one
+    request, as two root fields of a single mutation document.
+    """
     mutation = """
-    mutation CreateTransaction($input: CreateTransactionInput!) {
-      createTransaction(input: $input) {
+    mutation RecordRefund($transactionInput: CreateTransactionInput!, $sessionInput: UpdateSessionInput!) {
+      createTransaction(input: $transactionInput) {
         id
       }
+      updateSession(input: $sessionInput) {
+        id
+        purchaseStatus
+        _version
+      }
     }
     """
     variables = {
-        "input": {
+        "transactionInput": {
             "userTransactionsTransactionsId": user_transactions_id,
             "quantity": credits_refunded,  # Positive value for refunding
             "amount": 0,
@@ -86,7 +117,8 @@ def create_refund_transaction(user_transactions_id: str, session_id: str, credit
             "status": "COMPLETED",
             "stripePaymentIntentId": f"refund_session_{session_id}",
             "description": f"Credits refunded for session {session_id}"
-        }
+        },
+        "sessionInput": {"id": session_id, "purchaseStatus": "REFUNDED", "_version": session_version}
     }
     return execute_graphql_request(mutation, variables)
 
@@ -105,20 +137,6 @@ def get_session(session_id: str):
     response = execute_graphql_request(query, variables)
     return response.get("data", {}).get("getSession")
 
-def update_session_purchase_status(session_id: str, new_status: str, version: int):
-    """Updates the session's purchaseStatus."""
-    mutation = """
-    mutation UpdateSession($input: UpdateSessionInput!) {
-      updateSession(input: $input) {
-        id
-        purchaseStatus
-        _version
-      }
-    }
-    """
-    variables = {"input": {"id": session_id, "purchaseStatus": new_status, "_version": version}}
-    return execute_graphql_request(mutation, variables)
-
 # --- Main Lambda Handler ---
 def lambda_handler(event, context):
     """
@@ -149,9 +167,17 @@ def lambda_handler(event, context):
 
         print(f"📊 Refund request details: UserTransactionsID={user_transactions_id}, Session={session_id}, Credits={credits_to_refund}")
 
-        user_tx = get_user_transactions(user_transactions_id)
+        # The two reads are independent, so fetch them concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            user_tx_future = executor.submit(get_user_transactions, user_transactions_id)
+            session_future = executor.submit(get_session, session_id)
+            user_tx = user_tx_future.result()
+            session_info = session_future.result()
+
         if not user_tx:
             raise Exception("User transaction record not found.")
+        if not session_info:
+            raise Exception("Session record not found for updating purchaseStatus.")
         
         current_balance = user_tx.get('creditBalance', 0)
         new_balance = current_balance + credits_to_refund
@@ -161,19 +187,14 @@ def lambda_handler(event, context):
         if "errors" in update_user_tx_response and update_user_tx_response["errors"]:
             raise Exception(f"Failed to update user balance: {update_user_tx_response['errors']}")
 
-        print(f"📋 Creating refund transaction record...")
-        create_tx_response = create_refund_transaction(user_transactions_id, session_id, credits_to_refund)
-        if "errors" in create_tx_response and create_tx_response["errors"]:
-            raise Exception(f"Failed to create refund transaction record: {create_tx_response['errors']}")
-
-        # Update session purchaseStatus to REFUNDED
-        print(f"🔄 Updating session {session_id} purchaseStatus to REFUNDED...")
-        session_info = get_session(session_id)
-        if not session_info:
-            raise Exception("Session record not found for updating purchaseStatus.")
-        update_session_response = update_session_purchase_status(session_id, "REFUNDED", session_info["_version"])
-        if "errors" in update_session_response and update_session_response["errors"]:
-            raise Exception(f"Failed to update session purchaseStatus: {update_session_response['errors']}")
+        # Both writes depend only on the balance update having succeeded, so they share one request
+        print(f"📋 Creating refund transaction record and updating session {session_id} purchaseStatus to REFUNDED...")
+        record_refund_response = record_refund(user_transactions_id, session_id, credits_to_refund, session_info["_version"])
+        record_refund_data = record_refund_response.get("data") or {}
+        if not record_refund_data.get("createTransaction"):
+            raise Exception(f"Failed to create refund transaction record: {record_refund_response.get('errors')}")
+        if not record_refund_data.get("updateSession"):
+            raise Exception(f"Failed to update session purchaseStatus: {record_refund_response.get('errors')}")
 
         success_response = {
             "success": True,
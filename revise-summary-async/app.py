@@ -1,15 +1,21 @@
 # --- Standard Library Imports ---
 import os
 import json
-from typing import List, Optional, Dict, Any
-import traceback
+from typing import List, Optional, Dict, Any, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # --- Third-party Library Imports ---
+import orjson
 import requests # For making HTTP requests to AppSync
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import boto3
-from pydantic import BaseModel, Field, ValidationError
-import openai
-from openai import OpenAI
+# openai and pydantic are only needed by the background worker and are imported
+# on first use, so dispatcher cold starts don't pay for them
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 # --- CONFIGURATION ---
 OPENAI_API_KEY_FROM_ENV = os.environ.get('OPENAI_API_KEY')
@@ -19,6 +25,12 @@ AWS_REGION = os.environ.get('AWS_REGION', 'us-east-2')
 BUCKET_NAME = os.environ.get('BUCKET_NAME')
 S3_SOURCE_TRANSCRIPT_PREFIX = os.environ.get('S3_SOURCE_TRANSCRIPT_PREFIX', 'public/transcripts/full')
 S3_METADATA_PREFIX = os.environ.get('S3_METADATA_PREFIX', 'public/session-metadata')
+REWRITE_QUEUE_URL = os.environ.get('REWRITE_QUEUE_URL')
+MUTATIONS_PER_REQUEST = 25  # Aliased mutations per GraphQL document
+APPSYNC_MAX_WORKERS = 16  # Concurrent AppSync requests; must not exceed the session's pool_maxsize
+DEBUG_PAYLOAD_MAX_BYTES = 2000  # Larger GraphQL variables/errors are logged by size only
+S3_READ_CHUNK_BYTES = 1024 * 1024  # Chunk size when streaming the transcript from S3
+SEGMENTS_PAGE_LIMIT = 1000  # AppSync's maximum page size; most sessions fit in one page
 
 # --- VALIDATE ESSENTIAL CONFIGURATION ---
 if not OPENAI_API_KEY_FROM_ENV:
@@ -29,41 +41,53 @@ if not APPSYNC_API_KEY_FROM_ENV:
     raise ValueError("Environment variable APPSYNC_API_KEY not set!")
 if not BUCKET_NAME:
     raise ValueError("Environment variable BUCKET_NAME not set!")
+if not REWRITE_QUEUE_URL:
+    raise ValueError("Environment variable REWRITE_QUEUE_URL not set!")
 
 # --- AWS & OPENAI CLIENTS ---
 s3_client = boto3.client("s3", region_name=AWS_REGION)
-lambda_client = boto3.client("lambda", region_name=AWS_REGION)
-openai_client = OpenAI(api_key=OPENAI_API_KEY_FROM_ENV)
+sqs_client = boto3.client("sqs", region_name=AWS_REGION)
+
+# Pooled AppSync session reused across calls and warm invocations. Only throttled
+# (429) responses and failures to connect are retried. read=0/other=0 stop urllib3
+# from replaying a POST after a read timeout or dropped response, and 5xx is not
+# retried either: the request may already have bumped a segment's _version, so
+# replaying it would just fail with a conflict.
+appsync_session = requests.Session()
+appsync_session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, read=0, other=0, backoff_factor=0.2, status_forcelist=[429], allowed_methods=["POST"])
+))
+appsync_session.headers.update({
+    'Content-Type': 'application/json',
+    'x-api-key': APPSYNC_API_KEY_FROM_ENV
+})
 
 # --- Lookups for Generation Settings ---
-content_length_lookup = {
-    (0, 0.33): "Each segment length should be short and concise, around 2-4 sentences.",
-    (0.33, 0.66): "Segment length should be 4-5 sentences.",
-    (0.66, 1.01): "Each segment length should be highly detailed and verbose, around 6-8 sentences."
-}
-
-content_style_lookup = {
-    (0, 0.33): "Write in a direct, factual, to-the-point style.",
-    (0.33, 0.66): "Write in a balanced, narrative style.",
-    (0.66, 1.01): "Write in a highly narrative, descriptive, and dramatic manner."
-}
+# Indexed by setting_bucket(value): below 0.33, below 0.66, and the rest of the 0-1 slider range
+CONTENT_LENGTH = (
+    "Each segment length should be short and concise, around 2-4 sentences.",
+    "Segment length should be 4-5 sentences.",
+    "Each segment length should be highly detailed and verbose, around 6-8 sentences."
+)
+
+CONTENT_STYLE = (
+    "Write in a direct, factual, to-the-point style.",
+    "Write in a balanced, narrative style.",
+    "Write in a highly narrative, descriptive, and dramatic manner."
+)
+
+def setting_bucket(value: float) -> int:
+    return 0 if value < 0.33 else 1 if value < 0.66 else 2
 
 def get_generation_settings_string(instructions: Optional[Dict[str, Any]]) -> str:
     if not instructions:
         return "No specific generation settings were provided."
 
     parts = []
-    length_val = instructions.get("contentLength", 0.5)
-    for (start, end), desc in content_length_lookup.items():
-        if start <= length_val < end:
-            parts.append(desc)
-            break
-            
-    style_val = instructions.get("contentStyle", 0.5)
-    for (start, end), desc in content_style_lookup.items():
-        if start <= style_val < end:
-            parts.append(desc)
-            break
+    parts.append(CONTENT_LENGTH[setting_bucket(instructions.get("contentLength", 0.5))])
+    parts.append(CONTENT_STYLE[setting_bucket(instructions.get("contentStyle", 0.5))])
 
     tones = instructions.get("selectedTones")
     if tones and isinstance(tones, list):
@@ -80,13 +104,25 @@ def get_generation_settings_string(instructions: Optional[Dict[str, Any]]) -> st
         
     return "\n- ".join(parts) if parts else "Default generation settings were used."
 
-class SegmentContentForLLM(BaseModel):
-    title: str
-    description: str
+@lru_cache(maxsize=None)
+def get_openai_client() -> "OpenAI":
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY_FROM_ENV)
 
-class RevisedSummaryFromLLM(BaseModel):
-    revised_tldr: str = Field(description="The revised concise 'too long; didn't read' summary of the entire session.")
-    revised_sessionSegments: List[SegmentContentForLLM] = Field(description="A list of chronologically revised segments, each with a title and description.")
+@lru_cache(maxsize=None)
+def get_revised_summary_model():
+    """Builds the pydantic model for the LLM's response on first use."""
+    from pydantic import BaseModel, Field
+
+    class SegmentContentForLLM(BaseModel):
+        title: str
+        description: str
+
+    class RevisedSummaryFromLLM(BaseModel):
+        revised_tldr: str = Field(description="The revised concise 'too long; didn't read' summary of the entire session.")
+        revised_sessionSegments: List[SegmentContentForLLM] = Field(description="A list of chronologically revised segments, each with a title and description.")
+
+    return RevisedSummaryFromLLM
 
 # --- GraphQL Queries and Mutations ---
 GET_SESSION_QUERY = """
@@ -104,9 +140,10 @@ query GetSession($id: ID!) {
 }
 """
 
+# Queries the sessionSegmentsId index directly rather than filtering a listSegments scan
 LIST_SEGMENTS_BY_SESSION_QUERY = """
 query ListSegmentsBySession($sessionSegmentsId: ID!, $limit: Int, $nextToken: String) {
-  listSegments(filter: {sessionSegmentsId: {eq: $sessionSegmentsId}}, limit: $limit, nextToken: $nextToken) {
+  segmentsBySessionId(sessionSegmentsId: $sessionSegmentsId, limit: $limit, nextToken: $nextToken) {
     items {
       id
       _version
@@ -132,44 +169,54 @@ mutation UpdateSession($input: UpdateSessionInput!) {
 }
 """
 
-UPDATE_SEGMENT_MUTATION = """
-mutation UpdateSegment($input: UpdateSegmentInput!) {
-  updateSegment(input: $input) {
-    id
-    _version
-    title
-    description
-    image 
-    index
-    updatedAt
-  }
-}
-"""
+# Selection set for the aliased updateSegment mutations sent by execute_aliased_mutations
+SEGMENT_FIELDS = "id _version title description image index updatedAt"
 
 # --- AppSync & OpenAI Helper Functions ---
 def execute_graphql_request(query: str, variables: Optional[Dict[str, Any]] = None, debug: bool = True) -> Dict[str, Any]:
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': APPSYNC_API_KEY_FROM_ENV
-    }
-    payload = {"query": query, "variables": variables or {}}
+    payload = orjson.dumps({"query": query, "variables": variables or {}})
 
-    if debug: print(f"Executing GraphQL. URL: {APPSYNC_API_URL}, Query: {query[:150].replace(os.linesep, ' ')}..., Variables: {json.dumps(variables)}")
+    if debug:
+        variables_json = orjson.dumps(variables)
+        variables_log = variables_json.decode('utf-8') if len(variables_json) <= DEBUG_PAYLOAD_MAX_BYTES else f"<{len(variables_json)} bytes>"
+        print(f"Executing GraphQL. URL: {APPSYNC_API_URL}, Query: {query[:150].replace(os.linesep, ' ')}..., Variables: {variables_log}")
 
     try:
-        response = requests.post(APPSYNC_API_URL, headers=headers, json=payload, timeout=90)
+        response = appsync_session.post(APPSYNC_API_URL, data=payload, timeout=90)
         response.raise_for_status() 
-        response_json = response.json()
+        response_json = orjson.loads(response.content)
 
         if "errors" in response_json:
-            if debug: print(f"GraphQL Error: {json.dumps(response_json['errors'], indent=2)}")
+            if debug: print(f"GraphQL Error: {orjson.dumps(response_json['errors'], option=orjson.OPT_INDENT_2).decode('utf-8')}")
         return response_json
 
-    except requests.exceptions.RequestException as e: 
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e: 
         if debug: print(f"Error making AppSync request: {e}")
         return {"errors": [{"message": f"RequestException: {e}"}]}
 
-def get_openai_completion(prompt_text: str, client: OpenAI, model: str = "gpt-5.2", debug: bool = True) -> Optional[str]:
+def execute_aliased_mutations(field_name: str, input_type: str, selection: str, inputs: List[Dict[str, Any]], debug: bool = True) -> List[Optional[Dict[str, Any]]]:
+    """
+    Runs the same mutation for each input as aliased root fields (m0, m1, ...) of a few
+    GraphQL documents, MUTATIONS_PER_REQUEST at a time, with the documents sent
+    concurrently. Returns each input's result record, or None where it failed, in input order.
+    """
+    def run_chunk(chunk):
+        var_defs = ", ".join(f"$input{i}: {input_type}!" for i in range(len(chunk)))
+        fields = "\n".join(f"  m{i}: {field_name}(input: $input{i}) {{ {selection} }}" for i in range(len(chunk)))
+        document = f"mutation Batched{field_name[:1].upper()}{field_name[1:]}({var_defs}) {{\n{fields}\n}}"
+        response = execute_graphql_request(document, {f"input{i}": inp for i, inp in enumerate(chunk)}, debug=debug)
+        data = response.get("data") or {}
+        return [data.get(f"m{i}") for i in range(len(chunk))]
+
+    chunks = [inputs[i:i + MUTATIONS_PER_REQUEST] for i in range(0, len(inputs), MUTATIONS_PER_REQUEST)]
+    if not chunks:
+        return []
+    with ThreadPoolExecutor(max_workers=min(APPSYNC_MAX_WORKERS, len(chunks))) as executor:
+        chunk_results = list(executor.map(run_chunk, chunks))
+    return [record for chunk_result in chunk_results for record in chunk_result]
+
+def get_openai_completion(prompt_text: str, client: "OpenAI", model: str = "gpt-5.2", debug: bool = True) -> Optional[str]:
+    import openai
     if debug: print(f"Sending prompt to OpenAI (model: {model}). Prompt length: {len(prompt_text)}")
     messages = [{"role": "user", "content": prompt_text}]
     try:
@@ -196,11 +243,19 @@ def lambda_handler(event, context):
     """
     Acts as a dispatcher.
     - If called from the frontend (no 'is_background_worker' flag), it initiates the process.
-    - If called asynchronously by itself ('is_background_worker' is True), it performs the rewrite.
+    - If triggered by the rewrite queue (SQS records), it performs the rewrite for each message.
+    - If invoked directly with 'is_background_worker' set, it performs the rewrite.
     """
     debug = True
     if debug: print(f"Lambda triggered. Event: {json.dumps(event)}")
 
+    records = event.get("Records")
+    if records and records[0].get("eventSource") == "aws:sqs":
+        if debug: print(f"Executing as a background worker for {len(records)} queued request(s).")
+        for record in records:
+            handle_background_rewrite(orjson.loads(record["body"]), context, debug)
+        return
+
     if event.get("is_background_worker"):
         if debug: print("Executing as a background worker.")
         handle_background_rewrite(event, context, debug)
@@ -213,7 +268,7 @@ def handle_frontend_request(event, context, debug: bool = True):
     """
     Handles the initial request from the frontend.
     1. Sets the session status to 'REWRITING'.
-    2. Invokes the same Lambda asynchronously to do the work.
+    2. Queues the work on the rewrite queue, which triggers this Lambda's background worker.
     3. Returns an immediate success response to the client.
     """
     try:
@@ -247,11 +302,10 @@ def handle_frontend_request(event, context, debug: bool = True):
         
         async_payload = {"is_background_worker": True, "original_event_body": body}
 
-        if debug: print(f"Invoking self asynchronously. Function: {context.function_name}")
-        lambda_client.invoke(
-            FunctionName=context.function_name,
-            InvocationType='Event',
-            Payload=json.dumps(async_payload)
+        if debug: print(f"Queueing background rewrite on {REWRITE_QUEUE_URL}")
+        sqs_client.send_message(
+            QueueUrl=REWRITE_QUEUE_URL,
+            MessageBody=orjson.dumps(async_payload).decode('utf-8')
         )
 
         return {
@@ -262,7 +316,9 @@ def handle_frontend_request(event, context, debug: bool = True):
     except json.JSONDecodeError as e:
         return {'statusCode': 400, 'body': json.dumps({'error': f'Invalid JSON in request body: {str(e)}'})}
     except Exception as e:
-        if debug: print(f"Error in frontend request handler: {str(e)}"); traceback.print_exc()
+        if debug:
+            import traceback
+            print(f"Error in frontend request handler: {str(e)}"); traceback.print_exc()
         return {'statusCode': 500, 'body': json.dumps({'error': f'An unexpected error occurred: {str(e)}'})}
 
 def handle_background_rewrite(event, context, debug: bool = True):
@@ -278,6 +334,9 @@ def handle_background_rewrite(event, context, debug: bool = True):
         print("CRITICAL ERROR in background worker: sessionId not found in payload.")
         return
 
+    # Set from the TLDR update's response so the finally block can skip re-fetching the session
+    latest_session_version = None
+
     try:
         user_revisions = body.get('userRevisions', "")
         new_generation_instructions = body.get('generation_instructions')
@@ -285,8 +344,22 @@ def handle_background_rewrite(event, context, debug: bool = True):
         if not user_revisions:
             user_revisions = "No specific revisions were provided by the user. Please review the TLDR and all segments. Refine them for clarity, accuracy, narrative flow, and engagement, based on the full transcript."
 
-        # 1. Fetch Session & Segments
-        session_gql_response = execute_graphql_request(GET_SESSION_QUERY, {"id": session_id}, debug=debug)
+        # 1. Fetch Session & Segments; the session read overlaps the segment pages
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            session_future = executor.submit(execute_graphql_request, GET_SESSION_QUERY, {"id": session_id}, debug)
+
+            original_segments = []
+            segment_variables = {"sessionSegmentsId": session_id, "limit": SEGMENTS_PAGE_LIMIT, "nextToken": None}
+            while True:
+                segments_response = execute_graphql_request(LIST_SEGMENTS_BY_SESSION_QUERY, segment_variables, debug=debug)
+                segment_page = (segments_response.get("data") or {}).get("segmentsBySessionId") or {}
+                original_segments.extend(segment_page.get("items") or [])
+                segment_variables["nextToken"] = segment_page.get("nextToken")
+                if not segment_variables["nextToken"]:
+                    break
+
+            session_gql_response = session_future.result()
+
         current_session_data = session_gql_response.get("data", {}).get("getSession")
         if not current_session_data:
             raise ValueError(f"Failed to fetch session {session_id} in background worker.")
@@ -298,16 +371,6 @@ def handle_background_rewrite(event, context, debug: bool = True):
         if not campaign_id:
             raise ValueError(f"Campaign ID not found for session {session_id}.")
 
-        original_segments = []
-        next_token = None
-        while True:
-            segments_response = execute_graphql_request(LIST_SEGMENTS_BY_SESSION_QUERY, {"sessionSegmentsId": session_id, "limit": 100, "nextToken": next_token}, debug=debug)
-            segment_page = segments_response.get("data", {}).get("listSegments", {})
-            original_segments.extend(segment_page.get("items", []))
-            next_token = segment_page.get("nextToken")
-            if not next_token:
-                break
-        
         if not original_segments:
             raise ValueError(f"No segments found for session {session_id}.")
 
@@ -324,19 +387,24 @@ def handle_background_rewrite(event, context, debug: bool = True):
 
         try:
             s3_object = s3_client.get_object(Bucket=BUCKET_NAME, Key=transcript_key)
-            transcript_text = s3_object['Body'].read().decode('utf-8')
+            transcript_bytes = bytearray()
+            for chunk in s3_object['Body'].iter_chunks(S3_READ_CHUNK_BYTES):
+                transcript_bytes += chunk
+            transcript_text = transcript_bytes.decode('utf-8')
+            del transcript_bytes
         except s3_client.exceptions.NoSuchKey:
             raise ValueError(f"Transcript file not found at {transcript_key}")
 
         original_gen_instructions = None
         try:
             metadata_obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=metadata_key)
-            original_gen_instructions = json.loads(metadata_obj['Body'].read().decode('utf-8')).get("generation_instructions")
+            original_gen_instructions = orjson.loads(metadata_obj['Body'].read()).get("generation_instructions")
         except s3_client.exceptions.NoSuchKey:
             if debug: print(f"Metadata file not found at {metadata_key}.")
 
         # 3. Construct LLM Prompt
-        segments_for_prompt = [SegmentContentForLLM(title=s.get("title", ""), description=(s.get("description", [""])[-1] if s.get("description") else "")) for s in original_segments]
+        # Plain dicts in the shape of the LLM response's segments, serialized once with orjson for the prompt
+        segments_for_prompt = [{"title": s.get("title") or "", "description": (s.get("description") or [""])[-1] or ""} for s in original_segments]
         
         prompt = f"""You are Scribe, an AI assistant that revises TTRPG session summaries.
 Your task is to revise the TLDR and Session Segments based on the full transcript and user requests.
@@ -352,75 +420,104 @@ Original Full Session Transcript:
 <transcript>{transcript_text}</transcript>
 
 Current TLDR: {current_tldr_str}
-Current Session Segments: {json.dumps([s.model_dump() for s in segments_for_prompt], indent=2)}
+Current Session Segments: {orjson.dumps(segments_for_prompt).decode('utf-8')}
 User's Revision Requests: {user_revisions}
 
 Output a single JSON object with 'revised_tldr' (string) and 'revised_sessionSegments' (a list of objects with 'title' and 'description').
 """
         # 4. Call OpenAI
-        llm_response_str = get_openai_completion(prompt, openai_client, debug=debug)
+        llm_response_str = get_openai_completion(prompt, get_openai_client(), debug=debug)
         if not llm_response_str:
             raise ValueError("Failed to get response from OpenAI.")
 
-        llm_data = RevisedSummaryFromLLM.model_validate_json(llm_response_str)
+        llm_data = get_revised_summary_model().model_validate_json(llm_response_str)
 
         if len(llm_data.revised_sessionSegments) != len(original_segments):
             raise ValueError(f"LLM returned {len(llm_data.revised_sessionSegments)} segments, but expected {len(original_segments)}.")
 
         # 5. Update AppSync
-        # Update TLDR
+        # Update TLDR alongside the segment updates; the two touch different records
         update_session_input = {"id": session_id, "_version": session_version, "tldr": [llm_data.revised_tldr]}
-        update_session_response = execute_graphql_request(UPDATE_SESSION_MUTATION, {"input": update_session_input}, debug=debug)
-        if not update_session_response.get("data", {}).get("updateSession"):
-            print(f"Warning: Failed to update Session TLDR for {session_id}.")
-
-        # Update Segments (two-step clear and update)
-        for i, revised_segment in enumerate(llm_data.revised_sessionSegments):
-            original_segment = original_segments[i]
-            
-            clear_desc_input = {"id": original_segment["id"], "_version": original_segment["_version"], "description": []}
-            clear_response = execute_graphql_request(UPDATE_SEGMENT_MUTATION, {"input": clear_desc_input}, debug=debug)
-            
-            cleared_segment_data = clear_response.get("data", {}).get("updateSegment")
+        tldr_executor = ThreadPoolExecutor(max_workers=1)
+        tldr_future = tldr_executor.submit(execute_graphql_request, UPDATE_SESSION_MUTATION, {"input": update_session_input}, debug)
+
+        # Update Segments (two-step clear and update). Each step is sent as one batch of
+        # aliased mutations; the update step needs the _version returned by the clear.
+        clear_inputs = [
+            {"id": segment["id"], "_version": segment["_version"], "description": []}
+            for segment in original_segments
+        ]
+        cleared_segments = execute_aliased_mutations("updateSegment", "UpdateSegmentInput", SEGMENT_FIELDS, clear_inputs, debug=debug)
+
+        update_targets = []
+        update_inputs = []
+        for original_segment, revised_segment, cleared_segment_data in zip(original_segments, llm_data.revised_sessionSegments, cleared_segments):
             if not cleared_segment_data:
                 print(f"Warning: Failed to clear description for segment {original_segment['id']}. Skipping update.")
                 continue
 
-            new_version = cleared_segment_data["_version"]
             update_segment_input = {
                 "id": original_segment["id"],
-                "_version": new_version,
+                "_version": cleared_segment_data["_version"],
                 "title": revised_segment.title,
                 "description": [revised_segment.description]
             }
             if original_segment.get("index") is not None:
                 update_segment_input["index"] = original_segment["index"]
-
-            update_segment_response = execute_graphql_request(UPDATE_SEGMENT_MUTATION, {"input": update_segment_input}, debug=debug)
-            if not update_segment_response.get("data", {}).get("updateSegment"):
-                print(f"Warning: Failed to update content for segment {original_segment['id']}.")
+            update_targets.append(original_segment["id"])
+            update_inputs.append(update_segment_input)
+
+        updated_segments = execute_aliased_mutations("updateSegment", "UpdateSegmentInput", SEGMENT_FIELDS, update_inputs, debug=debug)
+        for segment_id, updated_segment_data in zip(update_targets, updated_segments):
+            if not updated_segment_data:
+                print(f"Warning: Failed to update content for segment {segment_id}.")
+
+        update_session_response = tldr_future.result()
+        tldr_executor.shutdown()
+        updated_session = (update_session_response.get("data") or {}).get("updateSession")
+        if updated_session:
+            latest_session_version = updated_session["_version"]
+        else:
+            print(f"Warning: Failed to update Session TLDR for {session_id}.")
 
         if debug: print("Background rewrite process completed successfully.")
 
     except Exception as e:
-        if debug: print(f"An error occurred during background rewrite for session {session_id}: {str(e)}"); traceback.print_exc()
+        if debug:
+            import traceback
+            print(f"An error occurred during background rewrite for session {session_id}: {str(e)}"); traceback.print_exc()
     
     finally:
         # This block ALWAYS runs, ensuring the transcriptionStatus is not left as 'REWRITING'.
         if debug: print(f"Executing finally block to reset transcriptionStatus for session {session_id}.")
         try:
-            final_session_gql_response = execute_graphql_request(GET_SESSION_QUERY, {"id": session_id}, debug=debug)
-            final_session_data = final_session_gql_response.get("data", {}).get("getSession")
-
-            if final_session_data:
-                final_version = final_session_data["_version"]
-                reset_status_input = {"id": session_id, "_version": final_version, "transcriptionStatus": "READ"}
-                if debug: print(f"Resetting transcriptionStatus to READ for session {session_id} with version {final_version}.")
-                execute_graphql_request(UPDATE_SESSION_MUTATION, {"input": reset_status_input}, debug=debug)
-                if debug: print("TranscriptionStatus reset to READ successfully.")
-            else:
-                if debug: print(f"Could not fetch session {session_id} in finally block to reset transcriptionStatus.")
+            status_reset = False
+            if latest_session_version is not None:
+                # Optimistic reset with the version returned by the TLDR update; only a
+                # conflict (or any other failure) falls through to the re-fetch below
+                reset_status_input = {"id": session_id, "_version": latest_session_version, "transcriptionStatus": "READ"}
+                if debug: print(f"Resetting transcriptionStatus to READ for session {session_id} with cached version {latest_session_version}.")
+                reset_response = execute_graphql_request(UPDATE_SESSION_MUTATION, {"input": reset_status_input}, debug=debug)
+                status_reset = bool((reset_response.get("data") or {}).get("updateSession"))
+                if status_reset:
+                    if debug: print("TranscriptionStatus reset to READ successfully.")
+                elif debug:
+                    print("Cached session version was stale; re-fetching session before resetting transcriptionStatus.")
+
+            if not status_reset:
+                final_session_gql_response = execute_graphql_request(GET_SESSION_QUERY, {"id": session_id}, debug=debug)
+                final_session_data = final_session_gql_response.get("data", {}).get("getSession")
+
+                if final_session_data:
+                    final_version = final_session_data["_version"]
+                    reset_status_input = {"id": session_id, "_version": final_version, "transcriptionStatus": "READ"}
+                    if debug: print(f"Resetting transcriptionStatus to READ for session {session_id} with version {final_version}.")
+                    execute_graphql_request(UPDATE_SESSION_MUTATION, {"input": reset_status_input}, debug=debug)
+                    if debug: print("TranscriptionStatus reset to READ successfully.")
+                else:
+                    if debug: print(f"Could not fetch session {session_id} in finally block to reset transcriptionStatus.")
 
         except Exception as final_e:
+            import traceback
             print(f"CRITICAL: Failed to reset transcriptionStatus for session {session_id} in finally block. Manual intervention may be required. Error: {final_e}")
             traceback.print_exc()
@@ -0,0 +1,24 @@
+import os
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("APPSYNC_API_URL", "https://example.invalid/graphql")
+os.environ.setdefault("APPSYNC_API_KEY", "test")
+os.environ.setdefault("BUCKET_NAME", "test")
+os.environ.setdefault("REWRITE_QUEUE_URL", "https://example.invalid/queue")
+
+import app
+
+
+class SettingBucketTest(unittest.TestCase):
+    def test_boundaries(self):
+        self.assertEqual(app.setting_bucket(0.0), 0)
+        self.assertEqual(app.setting_bucket(0.32), 0)
+        self.assertEqual(app.setting_bucket(0.33), 1)
+        self.assertEqual(app.setting_bucket(0.65), 1)
+        self.assertEqual(app.setting_bucket(0.66), 2)
+        self.assertEqual(app.setting_bucket(1.0), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
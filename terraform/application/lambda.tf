@@ -45,7 +45,7 @@ resource "aws_lambda_layer_version" "html_dependencies_layer" {
 
   layer_name          = "html-dependencies-layer-${var.environment}"
   compatible_runtimes = ["python3.10", "python3.11"]
-  description         = "Lambda Layer containing HTML processing dependencies (BeautifulSoup)"
+  description         = "Lambda Layer containing HTML processing dependencies (lxml)"
 }
 
 resource "aws_lambda_layer_version" "brevo_dependencies_layer" {
@@ -360,6 +360,7 @@ resource "aws_lambda_function" "revise_summary_async" {
       APPSYNC_API_KEY             = var.appsync_api_key
       S3_SOURCE_TRANSCRIPT_PREFIX = "public/transcripts/full"
       S3_METADATA_PREFIX          = "public/session-metadata"
+      REWRITE_QUEUE_URL           = aws_sqs_queue.revise_summary_queue.url
     }
   }
 
@@ -368,6 +369,37 @@ resource "aws_lambda_function" "revise_summary_async" {
   }
 }
 
+# Work queue between the revise-summary-async dispatcher and its background worker
+resource "aws_sqs_queue" "revise_summary_dlq" {
+  name                      = "revise-summary-dlq${local.config.function_suffix}"
+  message_retention_seconds = 1209600 # 14 days
+
+  tags = {
+    Environment = var.environment
+  }
+}
+
+resource "aws_sqs_queue" "revise_summary_queue" {
+  name                       = "revise-summary-queue${local.config.function_suffix}"
+  visibility_timeout_seconds = 360 # Must exceed the worker's 300s timeout
+  message_retention_seconds  = 3600
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.revise_summary_dlq.arn
+    maxReceiveCount     = 2
+  })
+
+  tags = {
+    Environment = var.environment
+  }
+}
+
+resource "aws_lambda_event_source_mapping" "revise_summary_queue_trigger" {
+  event_source_arn = aws_sqs_queue.revise_summary_queue.arn
+  function_name    = aws_lambda_function.revise_summary_async.arn
+  batch_size       = 1
+}
+
 # Lambda function for session-chat
 resource "aws_lambda_function" "session_chat" {
   function_name = "session-chat${local.config.function_suffix}"
@@ -645,17 +677,19 @@ resource "aws_lambda_function" "generate_narrative_summary" {
   source_code_hash = filebase64sha256("${path.module}/generate-narrative-summary.zip")
 
   layers = [
-    aws_lambda_layer_version.python_dependencies_layer.arn
+    aws_lambda_layer_version.python_dependencies_layer.arn,
+    aws_lambda_layer_version.faiss_dependencies_layer.arn
   ]
 
   environment {
     variables = {
-      BUCKET_NAME     = local.config.s3_bucket
-      ENVIRONMENT     = var.environment
-      OPENAI_API_KEY  = var.openai_api_key
-      APPSYNC_API_URL = var.appsync_api_url
-      APPSYNC_API_KEY = var.appsync_api_key
-      DYNAMODB_TABLE  = local.config.dynamodb_table
+      BUCKET_NAME                  = local.config.s3_bucket
+      ENVIRONMENT                  = var.environment
+      OPENAI_API_KEY               = var.openai_api_key
+      APPSYNC_API_URL              = var.appsync_api_url
+      APPSYNC_API_KEY              = var.appsync_api_key
+      DYNAMODB_TABLE               = local.config.dynamodb_table
+      CAMPAIGN_CONTEXT_CACHE_TABLE = aws_dynamodb_table.campaign_context_cache.name
     }
   }
 
@@ -751,20 +785,22 @@ resource "aws_lambda_function" "generate_entity_lore" {
 
   environment {
     variables = {
-      BUCKET_NAME                = local.config.s3_bucket
-      ENVIRONMENT                = var.environment
-      OPENAI_API_KEY             = var.openai_api_key
-      APPSYNC_API_URL            = var.appsync_api_url
-      APPSYNC_API_KEY            = var.appsync_api_key
+      BUCKET_NAME                  = local.config.s3_bucket
+      ENVIRONMENT                  = var.environment
+      OPENAI_API_KEY               = var.openai_api_key
+      APPSYNC_API_URL              = var.appsync_api_url
+      APPSYNC_API_KEY              = var.appsync_api_key
       # DynamoDB linker tables for setting owner field
-      CAMPAIGN_NPCS_TABLE        = local.config.campaign_npcs_table
-      CAMPAIGN_LOCATIONS_TABLE   = local.config.campaign_locations_table
-      CAMPAIGN_ADVENTURERS_TABLE = local.config.campaign_adventurers_table
-      CAMPAIGN_LOOT_ITEMS_TABLE  = local.config.campaign_loot_items_table
-      SESSION_NPCS_TABLE         = local.config.session_npcs_table
-      SESSION_LOCATIONS_TABLE    = local.config.session_locations_table
-      SESSION_ADVENTURERS_TABLE  = local.config.session_adventurers_table
-      SESSION_LOOT_ITEMS_TABLE   = local.config.session_loot_items_table
+      CAMPAIGN_NPCS_TABLE          = local.config.campaign_npcs_table
+      CAMPAIGN_LOCATIONS_TABLE     = local.config.campaign_locations_table
+      CAMPAIGN_ADVENTURERS_TABLE   = local.config.campaign_adventurers_table
+      CAMPAIGN_LOOT_ITEMS_TABLE    = local.config.campaign_loot_items_table
+      SESSION_NPCS_TABLE           = local.config.session_npcs_table
+      SESSION_LOCATIONS_TABLE      = local.config.session_locations_table
+      SESSION_ADVENTURERS_TABLE    = local.config.session_adventurers_table
+      SESSION_LOOT_ITEMS_TABLE     = local.config.session_loot_items_table
+      # Invalidated after new entities are created
+      CAMPAIGN_CONTEXT_CACHE_TABLE = aws_dynamodb_table.campaign_context_cache.name
     }
   }
 
@@ -43,6 +43,27 @@ data "aws_dynamodb_table" "session_adventurers_table" {
   name = local.config.session_adventurers_table
 }
 
+# Short-lived cache of per-campaign entity context for generate-narrative-summary
+resource "aws_dynamodb_table" "campaign_context_cache" {
+  name         = "CampaignContextCache${local.config.function_suffix}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "id"
+
+  attribute {
+    name = "id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Environment = var.environment
+  }
+}
+
 resource "aws_iam_role" "lambda_exec_role" {
   name = "lambda_s3_dynamodb_appsync_role_${var.environment}"
 
@@ -114,7 +135,8 @@ data "aws_iam_policy_document" "lambda_combined_policy_doc" {
       data.aws_dynamodb_table.campaign_adventurers_table.arn,
       data.aws_dynamodb_table.session_npcs_table.arn,
       data.aws_dynamodb_table.session_locations_table.arn,
-      data.aws_dynamodb_table.session_adventurers_table.arn
+      data.aws_dynamodb_table.session_adventurers_table.arn,
+      aws_dynamodb_table.campaign_context_cache.arn
     ]
   }
 
@@ -152,6 +174,17 @@ data "aws_iam_policy_document" "lambda_combined_policy_doc" {
     effect  = "Allow"
     resources = [aws_sfn_state_machine.audio_processing_state_machine.arn]
   }
+
+  statement {
+    actions = [
+      "sqs:SendMessage",
+      "sqs:ReceiveMessage",
+      "sqs:DeleteMessage",
+      "sqs:GetQueueAttributes"
+    ]
+    effect    = "Allow"
+    resources = [aws_sqs_queue.revise_summary_queue.arn]
+  }
 }
 
 resource "aws_iam_policy" "lambda_combined_policy" {